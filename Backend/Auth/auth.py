@@ -1,11 +1,14 @@
 import os
-import sqlite3
+import threading
 import uuid
 from datetime import datetime, timedelta
 from functools import wraps
 import jwt
 
 from ..Model import users as User
+from ..Model import app_db
+from . import auth_cache
+from . import password_pool
 from ..Model.users import APP_DB_PATH, User
 
 from pydantic import BaseModel
@@ -23,6 +26,7 @@ JWT_SECRET = os.environ.get("JWT_SECRET", "this-is-my-algorithm-something-23-yes
 JWT_ALGORITHM = os.environ.get("JWT_ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRES_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRES_MINUTES", 260))
 REFRESH_TOKEN_EXPIRES_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRES_DAYS", 7))
+SESSION_SWEEP_INTERVAL_SECONDS = int(os.environ.get("SESSION_SWEEP_INTERVAL_SECONDS", 900))
 
 ALLOWED_ROLES = {
     "user"
@@ -41,46 +45,40 @@ class UserRequest(BaseModel):
 
 # Session Table for future purpose
 
+INSERT_SESSION_SQL = "INSERT INTO sessions (username, refresh_token, expires_at) VALUES (?, ?, ?)"
+DELETE_SESSION_SQL = "DELETE FROM sessions WHERE refresh_token = ?"
+SELECT_SESSION_SQL = "SELECT username, expires_at FROM sessions WHERE refresh_token = ?"
+DELETE_EXPIRED_SESSIONS_SQL = "DELETE FROM sessions WHERE expires_at < ?"
+UPDATE_ROLE_SQL = "UPDATE users SET role = ? WHERE username = ?"
+
 def create_sessions_table():
-    conn = sqlite3.connect(APP_DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL,
-            refresh_token TEXT UNIQUE NOT NULL,
-            expires_at DATETIME NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-    conn.close()
+    with app_db.transaction(APP_DB_PATH) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL,
+                refresh_token TEXT UNIQUE NOT NULL,
+                expires_at DATETIME NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_username ON sessions (username)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)")
     
 
 def save_refresh_session(username, refresh_token, expires_at: datetime):
-    conn = sqlite3.connect(APP_DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO sessions (username, refresh_token, expires_at) VALUES (?, ?, ?)",
-        (username, refresh_token, expires_at.isoformat())
-    )
-    conn.commit()
-    conn.close()
+    with app_db.transaction(APP_DB_PATH) as conn:
+        conn.execute(INSERT_SESSION_SQL, (username, refresh_token, expires_at.isoformat()))
     
 def revoke_refresh_token(refresh_token):
-    conn = sqlite3.connect(APP_DB_PATH)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM sessions WHERE refresh_token = ?", (refresh_token,))
-    conn.commit()
-    conn.close()
+    with app_db.transaction(APP_DB_PATH) as conn:
+        conn.execute(DELETE_SESSION_SQL, (refresh_token,))
+    auth_cache.invalidate_token(refresh_token)
     
 
 def find_session_by_refresh_token(refresh_token):
-    conn = sqlite3.connect(APP_DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT username, expires_at FROM sessions WHERE refresh_token = ?", (refresh_token,))
-    row = cur.fetchone()
-    conn.close()
+    with app_db.transaction(APP_DB_PATH) as conn:
+        row = conn.execute(SELECT_SESSION_SQL, (refresh_token,)).fetchone()
     if not row:
         return None
     username, expires_at = row
@@ -90,6 +88,51 @@ def find_session_by_refresh_token(refresh_token):
         return None
     return {"username": username, "expires_at": expires_dt}
 
+
+def delete_expired_sessions():
+    # expires_at is stored as ISO-8601 text, which sorts chronologically
+    with app_db.transaction(APP_DB_PATH) as conn:
+        return conn.execute(DELETE_EXPIRED_SESSIONS_SQL, (datetime.utcnow().isoformat(),)).rowcount
+
+
+_sweeper_stop = threading.Event()
+
+
+def _sweep_sessions_forever():
+    while not _sweeper_stop.wait(SESSION_SWEEP_INTERVAL_SECONDS):
+        try:
+            removed = delete_expired_sessions()
+            if removed:
+                print(f"Session sweeper removed {removed} expired sessions")
+        except Exception as e:
+            print("Session sweeper failed: ", e)
+    app_db.close_thread_connections()
+
+
+@router.on_event("startup")
+def start_session_sweeper():
+    # Created once per worker at startup instead of on every login
+    create_sessions_table()
+    _sweeper_stop.clear()
+    threading.Thread(target=_sweep_sessions_forever, name="session-sweeper", daemon=True).start()
+
+
+@router.on_event("shutdown")
+def stop_session_sweeper():
+    _sweeper_stop.set()
+    password_pool.shutdown()
+
+
+async def run_password_task(task):
+    # Hashing runs on the worker pool; a full queue sheds load instead of piling up
+    try:
+        return await task
+    except password_pool.PasswordPoolBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="server busy, please retry",
+        )
+
 # JWT 
 
 def create_access_token(username: str, role: str):
@@ -121,14 +164,46 @@ def create_refresh_token(username: str):
     return token, now + timedelta(days=REFRESH_TOKEN_EXPIRES_DAYS)
 
 def decode_token(token: str):
+    # Verified claims are cached (keyed by token hash) until the token expires
+    payload = auth_cache.get_claims(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        auth_cache.put_claims(token, payload)
         return payload
     except jwt.ExpiredSignatureError:
         raise
     except jwt.InvalidTokenError:
         raise
     
+def find_user(username):
+    """
+    User.find_by_username behind the user cache; misses are not cached.
+    """
+    user = auth_cache.user_cache.get(username)
+    if user is None:
+        user = User.find_by_username(username)
+        if user is not None:
+            auth_cache.user_cache.set(username, user)
+    return user
+    
+def request_identity(request: Request):
+    """
+    (username, role) from an optional Bearer access token, used for quotas on
+    routes that don't require login. Unauthenticated callers are keyed by host.
+    """
+    auth_header = request.headers.get("Authorization", "")
+    if auth_header.startswith("Bearer "):
+        try:
+            payload = decode_token(auth_header.split(" ", 1)[1].strip())
+            if payload.get("type") == "access" and payload.get("sub"):
+                return payload["sub"], payload.get("role")
+        except Exception:
+            pass
+    host = request.client.host if request.client else "unknown"
+    return f"anonymous@{host}", "anonymous"
+    
 # JWT Auth Decorators 
 
 def token_required(
@@ -139,7 +214,6 @@ def token_required(
 
     try:
         payload = decode_token(token)
-        print("PAYLOAD:", payload)
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -163,6 +237,17 @@ def token_required(
 
     return payload
 
+def admin_required(payload: dict = Depends(token_required)):
+    """
+    Dependency for admin-only routes: a valid access token with role admin.
+    """
+    if payload.get("role") != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="forbidden: admin required",
+        )
+    return payload
+
 def roles_required(*required_roles):
     """
     Usage: @roles_required('admin') or @roles_required('admin', 'supplier')
@@ -295,8 +380,8 @@ async def register(request: RegisterUser):
                 detail="invalid access token",
             )
 
-    user = User.create(username, password, role=role_to_create)
-    print("User:  ",user)
+    password_hash = await run_password_task(password_pool.hash_password(password))
+    user = User.insert(username, password_hash, role=role_to_create)
     # try:
     # except Exception as e:
     #     raise HTTPException(
@@ -413,15 +498,13 @@ async def login(request: password):
             detail="username and password are required",
         )
 
-    user = User.find_by_username(username)
-    if not user or not user.verify_password(password):
+    user = find_user(username)
+    if not user or not await run_password_task(password_pool.verify_password(user.password_hash, password)):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="invalid username or password",
         )
 
-    create_sessions_table()
-
     access_token = create_access_token(user.username, user.role)
     refresh_token, refresh_expires_at = create_refresh_token(user.username)
 
@@ -498,7 +581,7 @@ async def refresh(request: UserRequest):
             detail="token username mismatch",
         )
 
-    user = User.find_by_username(username)
+    user = find_user(username)
     if not user:
         revoke_refresh_token(refresh_token)
         raise HTTPException(
@@ -598,17 +681,23 @@ async def assign_role(request: UserRequest):
             detail="target user not found",
         )
 
-    conn = sqlite3.connect(APP_DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
-        "UPDATE users SET role = ? WHERE username = ?",
-        (new_role, target_username),
-    )
-    conn.commit()
-    conn.close()
+    with app_db.transaction(APP_DB_PATH) as conn:
+        conn.execute(UPDATE_ROLE_SQL, (new_role, target_username))
+    # Cached user record and cached claims carry the old role
+    auth_cache.invalidate_user(target_username)
 
     return {
         "message": "role updated",
         "username": target_username,
         "role": new_role,
-    }
\ No newline at end of file
+    }
+
+
+@router.get("/cache-stats", tags=["users"], dependencies=[Depends(admin_required)])
+async def cache_stats():
+    return auth_cache.stats()
+
+
+@router.get("/hash-pool-stats", tags=["users"], dependencies=[Depends(admin_required)])
+async def hash_pool_stats():
+    return password_pool.stats()
@@ -0,0 +1,132 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get("AUTH_TOKEN_CACHE_TTL", 300))
+AUTH_USER_CACHE_SIZE = int(os.environ.get("AUTH_USER_CACHE_SIZE", 1000))
+AUTH_USER_CACHE_TTL = int(os.environ.get("AUTH_USER_CACHE_TTL", 60))
+
+
+class TTLCache:
+    """
+    Bounded LRU map whose entries also expire after a TTL.
+    Thread-safe; keeps hit / miss / eviction counters for monitoring.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[1] > time.monotonic()
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Decoded JWT claims keyed by token hash; the raw token is never kept
+token_cache = TTLCache(AUTH_TOKEN_CACHE_SIZE, AUTH_TOKEN_CACHE_TTL)
+# User records keyed by username
+user_cache = TTLCache(AUTH_USER_CACHE_SIZE, AUTH_USER_CACHE_TTL)
+
+# username -> token hashes cached for that user, to drop them on role changes
+_tokens_by_user = {}
+_tokens_by_user_lock = threading.Lock()
+
+
+def token_key(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def get_claims(token):
+    return token_cache.get(token_key(token))
+
+
+def put_claims(token, payload):
+    # Never serve claims past the token's own expiry
+    ttl = payload.get("exp", 0) - time.time()
+    key = token_key(token)
+    token_cache.set(key, payload, ttl=ttl)
+    username = payload.get("sub")
+    if username:
+        with _tokens_by_user_lock:
+            keys = _tokens_by_user.setdefault(username, set())
+            keys.add(key)
+            if len(keys) > 64:
+                # Forget hashes whose cache entries already expired or were evicted
+                keys.intersection_update({k for k in keys if k in token_cache})
+
+
+def invalidate_token(token):
+    token_cache.pop(token_key(token))
+
+
+def invalidate_user(username):
+    user_cache.pop(username)
+    with _tokens_by_user_lock:
+        keys = _tokens_by_user.pop(username, set())
+    for key in keys:
+        token_cache.pop(key)
+
+
+def stats():
+    return {
+        "tokens": token_cache.stats(),
+        "users": user_cache.stats(),
+    }
@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dotenv import load_dotenv
+from werkzeug.security import generate_password_hash, check_password_hash
+
+load_dotenv()
+
+# Password hashing is deliberately CPU-expensive. Running it inline in the
+# async register/login routes stalls the event loop, so it goes to a bounded
+# worker pool instead. hashlib's KDFs release the GIL, so threads already
+# spread across cores; "process" isolates the work completely.
+
+PASSWORD_HASH_EXECUTOR = os.environ.get("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 256))
+
+
+class PasswordPoolBusy(Exception):
+    pass
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "pending": 0,
+    "max_pending": 0,
+    "wait_seconds": 0.0,
+    "run_seconds": 0.0,
+}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                if PASSWORD_HASH_EXECUTOR == "process":
+                    _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    return _executor
+
+
+def _timed_call(fn, *args):
+    # Runs in the worker; wall-clock start time is comparable across processes
+    started = time.time()
+    result = fn(*args)
+    return started, time.time() - started, result
+
+
+async def _submit(fn, *args):
+    with _stats_lock:
+        if _stats["pending"] >= PASSWORD_HASH_MAX_PENDING:
+            _stats["rejected"] += 1
+            raise PasswordPoolBusy("password hashing queue is full")
+        _stats["submitted"] += 1
+        _stats["pending"] += 1
+        _stats["max_pending"] = max(_stats["max_pending"], _stats["pending"])
+
+    submitted = time.time()
+    loop = asyncio.get_running_loop()
+    try:
+        started, run_seconds, result = await loop.run_in_executor(_get_executor(), _timed_call, fn, *args)
+    except BaseException:
+        # Includes CancelledError (client went away), which is not an Exception
+        with _stats_lock:
+            _stats["failed"] += 1
+        raise
+    finally:
+        with _stats_lock:
+            _stats["pending"] -= 1
+
+    with _stats_lock:
+        _stats["completed"] += 1
+        _stats["wait_seconds"] += max(0.0, started - submitted)
+        _stats["run_seconds"] += run_seconds
+    return result
+
+
+async def hash_password(raw_password):
+    return await _submit(generate_password_hash, raw_password)
+
+
+async def verify_password(password_hash, raw_password):
+    return await _submit(check_password_hash, password_hash, raw_password)
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    completed = snapshot["completed"] or 1
+    return {
+        "executor": PASSWORD_HASH_EXECUTOR,
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_pending": PASSWORD_HASH_MAX_PENDING,
+        "submitted": snapshot["submitted"],
+        "completed": snapshot["completed"],
+        "failed": snapshot["failed"],
+        "rejected": snapshot["rejected"],
+        "pending": snapshot["pending"],
+        "peak_pending": snapshot["max_pending"],
+        "avg_queue_wait_ms": round(snapshot["wait_seconds"] / completed * 1000, 3),
+        "avg_hash_ms": round(snapshot["run_seconds"] / completed * 1000, 3),
+    }
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -1,10 +1,12 @@
 import os
-import httpx
+import re
+import json
 import numpy as np
+from functools import lru_cache
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings, AzureOpenAIEmbeddings
-from langchain_core.messages import SystemMessage, HumanMessage
-from langchain.chat_models import init_chat_model
+
+from ....LLM_Model import llm_gateway
+from ....Model import shared_cache
 
 load_dotenv()
 
@@ -14,6 +16,31 @@ def cosine_similarity(a, b):
     return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
 
 
+SCORING_LLM_MODEL = "gpt-5-chat"
+SCORING_EMBEDDING_MODEL = "text-embedding-3-large"
+SCORING_EMBEDDING_DIMENSIONS = 1536
+
+REGENERATION_INSTRUCTION = (
+    "Answer the statement using strictly ONLY the knowledge base below. "
+    "If the knowledge base does not support the statement, respond with 'NOT SUPPORTED'.\n\n"
+)
+
+# Batched regeneration: up to REGENERATION_BATCH_SIZE uncached prompts are
+# sent as independent tasks in one JSON-mode request. 1 (default) keeps one
+# request per prompt. Tasks the reply doesn't answer are regenerated singly.
+# Needs the shared cache, which is how batched answers reach regenerate().
+REGENERATION_BATCH_SIZE = int(os.getenv("REGENERATION_BATCH_SIZE", 1))
+
+BATCH_REGENERATION_INSTRUCTION = (
+    "You will receive a JSON list of independent tasks, each with an id and a prompt. "
+    "Treat every task in isolation: answer it using strictly ONLY the knowledge base in its own prompt, "
+    "never information from another task. "
+    "If a task's knowledge base does not support its statement, its answer is 'NOT SUPPORTED'.\n"
+    'Reply with a JSON object only: {"answers": [{"id": <task id>, "answer": "<best supported answer>"}]}, '
+    "one entry per task."
+)
+
+
 #  Validate env credentials
 # if not os.getenv("API_URI"):
 #     raise RuntimeError("API_URI not set")
@@ -22,23 +49,132 @@ def cosine_similarity(a, b):
 # if not os.getenv("API_KEY"):
 #     raise RuntimeError("API_KEY not set")
 
-client = httpx.Client(verify=False)
+# Clients are built on the first scoring call, not at import, so the API
+# starts without langchain loaded or Azure reachable
 
-llm = init_chat_model(
-    model= "gpt-5-chat",
-    model_provider= "azure_openai",
-    api_version = "2024-12-01-preview",
-    azure_endpoint = "https://oraon-mkwbdbz8-eastus2.cognitiveservices.azure.com/openai/deployments/gpt-5-chat/chat/completions?api-version=2025-01-01-preview",
-    api_key = "EcWUgCVMSBvtNSMqWlYyxdsvXUSuBIHpGkMaoxYWdKYpshDn72uMJQQJ99CAACHYHv6XJ3w3AAAAACOGz8ml",
-)
+@lru_cache(maxsize=1)
+def get_llm():
+    from langchain.chat_models import init_chat_model
+
+    return init_chat_model(
+        model= SCORING_LLM_MODEL,
+        model_provider= "azure_openai",
+        api_version = "2024-12-01-preview",
+        azure_endpoint = os.getenv("SCORING_LLM_ENDPOINT", "https://oraon-mkwbdbz8-eastus2.cognitiveservices.azure.com/openai/deployments/gpt-5-chat/chat/completions?api-version=2025-01-01-preview"),
+        api_key = os.getenv("SCORING_API_KEY", "EcWUgCVMSBvtNSMqWlYyxdsvXUSuBIHpGkMaoxYWdKYpshDn72uMJQQJ99CAACHYHv6XJ3w3AAAAACOGz8ml"),
+        # Retries are handled by llm_gateway so backoff honours the shared limits
+        max_retries = 0,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_embedder():
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    return AzureOpenAIEmbeddings(
+        model=SCORING_EMBEDDING_MODEL,
+        dimensions=SCORING_EMBEDDING_DIMENSIONS,
+        api_version="2023-05-15",
+        azure_endpoint=os.getenv("SCORING_EMBEDDING_ENDPOINT", "https://oraon-mkwbdbz8-eastus2.cognitiveservices.azure.com/openai/deployments/text-embedding-3-large/embeddings?api-version=2023-05-15"),
+        api_key=os.getenv("SCORING_API_KEY", "EcWUgCVMSBvtNSMqWlYyxdsvXUSuBIHpGkMaoxYWdKYpshDn72uMJQQJ99CAACHYHv6XJ3w3AAAAACOGz8ml"),
+        max_retries=0,
+    )
+
+
+def regeneration_key(prompt, batch_size=REGENERATION_BATCH_SIZE):
+    # Batched answers come from a different prompt, so the two modes never
+    # share cache entries: scores don't depend on which mode warmed the cache.
+    # Single-call keys are unchanged from before batching existed.
+    if batch_size > 1:
+        return shared_cache.make_key(SCORING_LLM_MODEL, "batch", prompt)
+    return shared_cache.make_key(SCORING_LLM_MODEL, prompt)
+
+
+def regenerate(prompt: str) -> str:
+    """
+    KB-constrained answer for a prompt. It does not depend on the agent's
+    answer, so it is cached across test cases, runs and worker processes.
+    """
+    key = regeneration_key(prompt)
+    cached = shared_cache.get_json("regeneration", key)
+    if cached is not None:
+        return cached
+
+    from langchain_core.messages import SystemMessage, HumanMessage
+
+    messages = [
+        SystemMessage(content=REGENERATION_INSTRUCTION + prompt),
+        HumanMessage(content="Generate the best supported answer.")
+    ]
+    regenerated = llm_gateway.invoke_chat(get_llm(), messages).content
+    shared_cache.set_json("regeneration", key, regenerated)
+    return regenerated
+
+
+def _parse_batch_answers(content, ids):
+    # Tolerate a fenced reply; anything else malformed falls back to single calls
+    text = re.sub(r"^\s*```(?:json)?|```\s*$", "", content).strip()
+    try:
+        entries = json.loads(text)["answers"]
+    except (ValueError, KeyError, TypeError):
+        return {}
+    answers = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if isinstance(entry, dict) and entry.get("id") in ids and isinstance(entry.get("answer"), str) and entry["answer"].strip():
+            answers[entry["id"]] = entry["answer"]
+    return answers
 
-embedder = AzureOpenAIEmbeddings(
-    model="text-embedding-3-large",
-    dimensions=1536,
-    api_version="2023-05-15",
-    azure_endpoint="https://oraon-mkwbdbz8-eastus2.cognitiveservices.azure.com/openai/deployments/text-embedding-3-large/embeddings?api-version=2023-05-15",
-    api_key="EcWUgCVMSBvtNSMqWlYyxdsvXUSuBIHpGkMaoxYWdKYpshDn72uMJQQJ99CAACHYHv6XJ3w3AAAAACOGz8ml"
-)
+
+def _regenerate_batch(prompts):
+    from langchain_core.messages import SystemMessage, HumanMessage
+
+    tasks = [{"id": i, "prompt": REGENERATION_INSTRUCTION + prompt} for i, prompt in enumerate(prompts)]
+    messages = [
+        SystemMessage(content=BATCH_REGENERATION_INSTRUCTION),
+        HumanMessage(content=json.dumps(tasks)),
+    ]
+    try:
+        llm = get_llm().bind(response_format={"type": "json_object"})
+        answers = _parse_batch_answers(llm_gateway.invoke_chat(llm, messages).content, set(range(len(prompts))))
+    except Exception as e:
+        print("Batched regeneration failed, falling back to single calls: ", e)
+        answers = {}
+    return [answers.get(i) for i in range(len(prompts))]
+
+
+def regenerate_many(prompts, batch_size=REGENERATION_BATCH_SIZE):
+    """
+    Warm the regeneration cache for many prompts, batch_size prompts per
+    request. regenerate() then serves each of them from the cache.
+    """
+    # Batched answers reach regenerate() through the shared cache only
+    if batch_size <= 1 or not shared_cache.SHARED_CACHE_ENABLED:
+        return
+    pending = []
+    for prompt in dict.fromkeys(prompts):
+        if shared_cache.get_json("regeneration", regeneration_key(prompt)) is None:
+            pending.append(prompt)
+
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        if len(batch) == 1:
+            regenerate(batch[0])
+            continue
+        for prompt, regenerated in zip(batch, _regenerate_batch(batch)):
+            if regenerated is None:
+                regenerate(prompt)
+            else:
+                shared_cache.set_json("regeneration", regeneration_key(prompt), regenerated)
+
+
+def embed(text: str):
+    key = shared_cache.make_key(SCORING_EMBEDDING_MODEL, SCORING_EMBEDDING_DIMENSIONS, text)
+    cached = shared_cache.get_vector("embedding", key)
+    if cached is not None:
+        return cached
+    vector = llm_gateway.embed_query(get_embedder(), text)
+    shared_cache.set_vector("embedding", key, vector)
+    return vector
 
 
 def score_answer(prompt: str, agent_answer: str) -> float:
@@ -49,19 +185,8 @@ def score_answer(prompt: str, agent_answer: str) -> float:
     - regenerated answer constrained by KB
     """
     
-    messages = [
-        SystemMessage(
-            content=(
-                "Answer the statement using strictly ONLY the knowledge base below. "
-                "If the knowledge base does not support the statement, respond with 'NOT SUPPORTED'.\n\n"
-                f"{prompt}"
-            )
-        ),
-        HumanMessage(content="Generate the best supported answer.")
-    ]
-    
     # print("HAHA: ",messages )
-    regenerated = llm.invoke(messages).content
+    regenerated = regenerate(prompt)
     
     # print("outy_: ", regenerated)
     
@@ -70,8 +195,8 @@ def score_answer(prompt: str, agent_answer: str) -> float:
     
     
     
-    emb_agent = embedder.embed_query(agent_answer)
-    emb_regen = embedder.embed_query(regenerated)
+    emb_agent = embed(agent_answer)
+    emb_regen = embed(regenerated)
 
     # print("Embedd_", emb_agent)
     print("Regenerated: ", regenerated)
@@ -0,0 +1,94 @@
+import os
+import re
+import hashlib
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Collapse duplicate KB chunks before attribution.
+#
+# Retrieval often returns the same passage twice, or overlapping windows of
+# it, and every chunk costs a regeneration + embedding per coalition. Chunks
+# are grouped when their normalised text is identical (hash) or when the
+# MinHash estimate of their word-shingle Jaccard similarity reaches
+# CHUNK_NEAR_DUP_THRESHOLD. Only the first chunk of a group (best retrieval
+# rank) is scored; its attribution is then split equally across the group.
+
+CHUNK_DEDUP = os.getenv("CHUNK_DEDUP", "1") == "1"
+CHUNK_NEAR_DUP_THRESHOLD = float(os.getenv("CHUNK_NEAR_DUP_THRESHOLD", 0.85))
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", 128))
+SHINGLE_SIZE = 3
+
+_rng = np.random.default_rng(0x5EED)
+# Odd multipliers give distinct multiply-shift hashes over uint64
+_hash_a = _rng.integers(1, 2**63, size=MINHASH_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_hash_b = _rng.integers(0, 2**63, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def normalise(text):
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+def _hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def shingles(text):
+    words = text.split()
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    hashed = np.fromiter((_hash64(s) for s in shingles(text)), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        # (a * x + b) mod 2^64 for every (permutation, shingle), then the minimum per permutation
+        permuted = hashed[None, :] * _hash_a[:, None] + _hash_b[:, None]
+    return permuted.min(axis=1)
+
+
+def dedupe_chunks(chunks, threshold=CHUNK_NEAR_DUP_THRESHOLD):
+    """
+    Returns (representative chunks, groups) where groups[j] lists the
+    original positions represented by representatives[j].
+    """
+    normalised = [normalise(chunk) for chunk in chunks]
+    representatives = []
+    groups = []
+    exact = {}          # text hash -> group index
+    signatures = []     # MinHash signature per group representative
+
+    for position, text in enumerate(normalised):
+        digest = _hash64(text)
+        group = exact.get(digest)
+        if group is None and threshold < 1.0:
+            signature = minhash(text)
+            for index, other in enumerate(signatures):
+                if np.mean(signature == other) >= threshold:
+                    group = index
+                    break
+        if group is None:
+            group = len(groups)
+            representatives.append(chunks[position])
+            groups.append([])
+            signatures.append(signature if threshold < 1.0 else None)
+        exact.setdefault(digest, group)
+        groups[group].append(position)
+
+    return representatives, groups
+
+
+def spread_similarities(baseline, similarities, groups, n):
+    """
+    Per-representative similarities -> per-original-chunk values. A group of
+    k chunks shares the representative's attribution equally.
+    """
+    spread = np.empty(n, dtype=np.float64)
+    for similarity, members in zip(similarities, groups):
+        if len(members) == 1:
+            spread[members[0]] = similarity
+        else:
+            spread[members] = baseline + (similarity - baseline) / len(members)
+    return spread
@@ -0,0 +1,148 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+from ..Model_Interaction.model_cosine_score import SCORING_LLM_MODEL, SCORING_EMBEDDING_MODEL
+
+load_dotenv()
+
+# Coalition values shared by every attribution estimator.
+#
+# Estimators address subsets of one answer's chunks as int bitmasks over the
+# chunk positions. The cache key is position-free: a digest of (answer hash,
+# sorted chunk ids, scoring models), so the same subset is scored once no
+# matter which estimator asks, in what order the chunks were retrieved, or
+# which test case retrieved them.
+
+SHAP_COALITION_CACHE_SIZE = int(os.getenv("SHAP_COALITION_CACHE_SIZE", 50000))
+
+MODEL_KEY = f"{SCORING_LLM_MODEL}|{SCORING_EMBEDDING_MODEL}"
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+class LRUCache:
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __contains__(self, key):
+        # Membership only: no LRU reordering, no hit/miss accounting
+        with self._lock:
+            return key in self._data
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+coalition_cache = LRUCache(SHAP_COALITION_CACHE_SIZE)
+
+
+def content_id(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class CoalitionValues:
+    """
+    v(S) for one answer, S a bitmask over knowledge_base positions.
+    score_chunks(chunks) does the real (LLM-backed) scoring; it is called only
+    for subsets no estimator has scored yet, and those calls count against
+    max_calls when a budget is given. prefetch_chunks(list of chunk lists),
+    if given, may prepare many subsets in one go (see prefetch()).
+    """
+
+    def __init__(self, knowledge_base, agent_answer, score_chunks, max_calls=None, prefetch_chunks=None):
+        self.knowledge_base = knowledge_base
+        self.score_chunks = score_chunks
+        self.prefetch_chunks = prefetch_chunks
+        self.max_calls = max_calls
+        self.answer_id = content_id(agent_answer)
+        self.chunk_ids = [content_id(chunk) for chunk in knowledge_base]
+        self.values = {}
+        self.calls = 0
+        self.hits = 0
+
+    def members(self, mask):
+        # Chunks in chunk-id order, so the prompt (and its value) depends only on the set
+        positions = [i for i in range(len(self.knowledge_base)) if mask >> i & 1]
+        return sorted(positions, key=lambda i: self.chunk_ids[i])
+
+    def key(self, mask):
+        ids = "|".join(self.chunk_ids[i] for i in self.members(mask))
+        return hashlib.blake2b(f"{self.answer_id}|{MODEL_KEY}|{ids}".encode("utf-8"), digest_size=16).digest()
+
+    def prefetch(self, masks):
+        """
+        Hand every not-yet-scored subset among masks to prefetch_chunks at
+        once (e.g. to batch their LLM requests) before they are valued one by
+        one. Skipped when they could not all be scored within the budget.
+        """
+        if self.prefetch_chunks is None:
+            return
+        missing = [mask for mask in dict.fromkeys(masks) if mask not in self.values and self.key(mask) not in coalition_cache]
+        if not missing or (self.max_calls is not None and self.calls + len(missing) > self.max_calls):
+            return
+        self.prefetch_chunks([[self.knowledge_base[i] for i in self.members(mask)] for mask in missing])
+
+    def __call__(self, mask):
+        if mask in self.values:
+            self.hits += 1
+            return self.values[mask]
+
+        key = self.key(mask)
+        value = coalition_cache.get(key)
+        if value is not None:
+            self.hits += 1
+        else:
+            if self.max_calls is not None and self.calls >= self.max_calls:
+                raise BudgetExhausted()
+            self.calls += 1
+            value = self.score_chunks([self.knowledge_base[i] for i in self.members(mask)])
+            coalition_cache.put(key, value)
+
+        self.values[mask] = value
+        return value
+
+
+def stats():
+    return coalition_cache.stats()
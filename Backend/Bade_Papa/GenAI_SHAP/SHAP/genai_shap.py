@@ -1,5 +1,20 @@
+import os
 import numpy as np
-from ..Model_Interaction.model_cosine_score import score_answer
+from ..Model_Interaction.model_cosine_score import score_answer, regenerate_many
+from ....LLM_Model import llm_gateway
+from .coalition_cache import CoalitionValues
+from .permutation_shap import permutation_shapley
+from .chunk_dedup import CHUNK_DEDUP, dedupe_chunks, spread_similarities
+
+# "loo": each chunk alone vs. the no-evidence baseline (n + 1 LLM calls)
+# "permutation": sampled Shapley values with early stopping (permutation_shap.py)
+SHAP_ESTIMATOR = os.getenv("SHAP_ESTIMATOR", "loo")
+
+# Token budget for the evidence section of a scoring prompt: no chunk exceeds
+# SHAP_CHUNK_TOKEN_LIMIT, and the chunks of one answer together fit
+# SHAP_EVIDENCE_TOKEN_BUDGET, so even the grand coalition's prompt is bounded.
+SHAP_CHUNK_TOKEN_LIMIT = int(os.getenv("SHAP_CHUNK_TOKEN_LIMIT", 1000))
+SHAP_EVIDENCE_TOKEN_BUDGET = int(os.getenv("SHAP_EVIDENCE_TOKEN_BUDGET", 6000))
 
 
 def build_prompt(kb_chunks):
@@ -29,26 +44,107 @@ def build_prompt(kb_chunks):
             """
 
 
-def compute_genai_shap(knowledge_base, agent_answer):
-    shap_values = []
-    total_token = 0
-    
-    # print("Knowledge_Base: ", knowledge_base)
+def fit_chunks_to_budget(kb_chunks, chunk_limit=SHAP_CHUNK_TOKEN_LIMIT, budget=SHAP_EVIDENCE_TOKEN_BUDGET):
+    """
+    Truncate chunks so each fits chunk_limit tokens and all of them fit budget.
+    Short chunks keep their full text; what they leave unused is shared
+    equally among the longer ones. Returns (chunks, budget report).
+    """
+    counts = [llm_gateway.count_tokens(chunk) for chunk in kb_chunks]
+    allowed = [0] * len(kb_chunks)
+    remaining = budget
+    # Smallest first, so each chunk's fair share includes what smaller ones left
+    for rank, i in enumerate(sorted(range(len(kb_chunks)), key=counts.__getitem__)):
+        allowed[i] = min(counts[i], chunk_limit, remaining // (len(kb_chunks) - rank))
+        remaining -= allowed[i]
+
+    fitted = []
+    truncated = 0
+    for chunk, count, limit in zip(kb_chunks, counts, allowed):
+        if count > limit:
+            chunk, _ = llm_gateway.truncate_to_tokens(chunk, limit)
+            truncated += 1
+        fitted.append(chunk)
+
+    report = {
+        "evidence_tokens": sum(counts),
+        "evidence_tokens_saved": sum(counts) - sum(allowed),
+        "truncated_chunks": truncated,
+    }
+    return fitted, report
+
+
+def compute_similarities(knowledge_base, agent_answer, estimator=None):
+    """
+    Raw scoring artifacts: the no-evidence baseline score and, per chunk, a
+    similarity-equivalent value (baseline + attribution), plus token usage
+    and a cost report for the answer.
+    """
+    estimator = estimator or SHAP_ESTIMATOR
+
+    def score_chunks(chunks):
+        return score_answer(build_prompt(chunks), agent_answer)
+
+    def prefetch_chunks(coalitions):
+        # Regeneration depends only on the prompt: batch the ones about to be needed
+        regenerate_many([build_prompt(chunks) for chunks in coalitions])
+
+    # Duplicate chunks are scored once; the group shares the attribution
+    if CHUNK_DEDUP:
+        representatives, groups = dedupe_chunks(knowledge_base)
+    else:
+        representatives, groups = knowledge_base, [[i] for i in range(len(knowledge_base))]
+    representatives, budget_report = fit_chunks_to_budget(representatives)
+
+    with llm_gateway.track_usage() as total_token:
+        if estimator == "permutation":
+            baseline_score, phi, cost = permutation_shapley(
+                representatives, agent_answer, score_chunks, prefetch_chunks=prefetch_chunks
+            )
+            similarities = baseline_score + phi
+        else:
+            baseline_score, similarities, cost = leave_one_in_similarities(
+                representatives, agent_answer, score_chunks, prefetch_chunks
+            )
+
+    similarities = spread_similarities(baseline_score, similarities, groups, len(knowledge_base))
+    cost["chunks"] = len(knowledge_base)
+    cost["unique_chunks"] = len(representatives)
+    cost.update(budget_report)
+    cost["tokens"] = dict(total_token)
+    print("SHAP cost: ", cost)
+    return baseline_score, similarities, total_token, cost
+
+
+def leave_one_in_similarities(knowledge_base, agent_answer, score_chunks, prefetch_chunks=None):
+    value = CoalitionValues(knowledge_base, agent_answer, score_chunks, prefetch_chunks=prefetch_chunks)
+    value.prefetch([0] + [1 << i for i in range(len(knowledge_base))])
 
     # Baseline: task context only, no evidence
-    baseline_prompt = build_prompt([])
-    baseline_score = score_answer(baseline_prompt, agent_answer)
-
-    for chunk in knowledge_base:
-        # print("Chunk: ")
-        prompt = build_prompt([chunk])
-        # print("prompt")
-        score_resp = score_answer(prompt, agent_answer)
-        print("score", score_resp)
-        score = score_resp
-        # tokens = score_resp[1]
-        print("score_Token")
-        # total_token += tokens
-        shap_values.append(score - baseline_score)
-
-    return np.array(shap_values), total_token
+    baseline_score = value(0)
+
+    similarities = []
+    for i in range(len(knowledge_base)):
+        score = value(1 << i)
+        print("score", score)
+        similarities.append(score)
+
+    cost = {
+        "estimator": "loo",
+        "chunks": len(knowledge_base),
+        "llm_calls": value.calls,
+        "coalition_cache_hits": value.hits,
+    }
+    return baseline_score, similarities, cost
+
+
+def shap_from_similarities(baseline_score, similarities):
+    return np.asarray(similarities, dtype=np.float64) - baseline_score
+
+
+def compute_genai_shap(knowledge_base, agent_answer):
+    """
+    Returns (per-chunk SHAP values, token usage of the LLM / embedding calls).
+    """
+    baseline_score, similarities, total_token, _ = compute_similarities(knowledge_base, agent_answer)
+    return shap_from_similarities(baseline_score, similarities), total_token
@@ -0,0 +1,139 @@
+import os
+import math
+import numpy as np
+from dotenv import load_dotenv
+
+from .coalition_cache import BudgetExhausted, CoalitionValues
+
+load_dotenv()
+
+# Sampled-permutation Shapley values over KB chunks.
+#
+# The value of a coalition S of chunks is the similarity between the agent
+# answer and the answer regenerated from S alone (v(empty) is the
+# no-evidence baseline). Unlike the leave-one-in deltas, a chunk's value is
+# averaged over the contexts it can appear in, so redundant or complementary
+# chunks are attributed properly.
+#
+# Permutations are drawn in antithetic pairs (a permutation and its reverse)
+# and coalitions come from the shared coalition cache, so each subset is
+# scored at most once across answers and estimators. Sampling stops when
+# the confidence interval of every chunk's value is narrower than
+# SHAP_TOLERANCE, or when the next pair would exceed the LLM-call budget
+# (at least 2n, enough for one pair; at least one pair is always sampled,
+# whatever SHAP_MAX_PERMUTATIONS says). If the budget covers all 2^n
+# coalitions the values are computed exactly instead.
+
+SHAP_MAX_LLM_CALLS = int(os.getenv("SHAP_MAX_LLM_CALLS", 32))
+SHAP_TOLERANCE = float(os.getenv("SHAP_TOLERANCE", 0.01))
+SHAP_CONFIDENCE_Z = float(os.getenv("SHAP_CONFIDENCE_Z", 1.96))
+SHAP_MIN_PERMUTATIONS = int(os.getenv("SHAP_MIN_PERMUTATIONS", 4))
+SHAP_MAX_PERMUTATIONS = int(os.getenv("SHAP_MAX_PERMUTATIONS", 200))
+SHAP_SEED = os.getenv("SHAP_SEED")
+
+
+def exact_shapley(values, n):
+    """
+    Shapley values from a complete table of 2^n coalition values.
+    """
+    phi = np.zeros(n)
+    weights = [math.factorial(size) * math.factorial(n - size - 1) / math.factorial(n) for size in range(n)]
+    for mask in range(1 << n):
+        size = bin(mask).count("1")
+        for i in range(n):
+            if not mask >> i & 1:
+                phi[i] += weights[size] * (values[mask | 1 << i] - values[mask])
+    return phi
+
+
+def _prefixes(order):
+    # Coalitions visited when adding the chunks in this order
+    masks = [0]
+    for i in order:
+        masks.append(masks[-1] | 1 << i)
+    return masks
+
+
+def _marginals(order, value):
+    # Marginal contribution of each chunk when added in this order
+    contributions = np.zeros(len(order))
+    mask = 0
+    previous = value(0)
+    for i in order:
+        mask |= 1 << i
+        current = value(mask)
+        contributions[i] = current - previous
+        previous = current
+    return contributions
+
+
+def permutation_shapley(knowledge_base, agent_answer, score_chunks,
+                        max_llm_calls=SHAP_MAX_LLM_CALLS, tolerance=SHAP_TOLERANCE,
+                        min_permutations=SHAP_MIN_PERMUTATIONS, max_permutations=SHAP_MAX_PERMUTATIONS,
+                        seed=SHAP_SEED, prefetch_chunks=None):
+    """
+    score_chunks(chunks) scores one coalition; prefetch_chunks, if given,
+    receives the coalitions each step will need before they are scored.
+    Returns (baseline score, Shapley value per chunk, cost report).
+    """
+    n = len(knowledge_base)
+    # One antithetic pair needs at most 2n coalitions; never budget for less than that
+    max_llm_calls = max(max_llm_calls, 2 * n)
+    # ...and always sample at least that pair, so there is a mean to return
+    max_permutations = max(max_permutations, 2)
+    value = CoalitionValues(knowledge_base, agent_answer, score_chunks, max_llm_calls, prefetch_chunks)
+    full_mask = (1 << n) - 1
+    exact = (1 << n) <= max_llm_calls
+    value.prefetch(range(1 << n) if exact else (0, full_mask))
+    # Baseline and grand coalition are needed by every permutation
+    baseline = value(0)
+    value(full_mask)
+
+    if exact:
+        for mask in range(1 << n):
+            value(mask)
+        phi = exact_shapley(value.values, n)
+        return baseline, phi, _cost(value, n, 0, "exact", 0.0)
+
+    rng = np.random.default_rng(int(seed) if seed is not None else None)
+    # The two halves of a pair are correlated, so the pair mean is the sample
+    total = np.zeros(n)
+    total_sq = np.zeros(n)
+    pairs = 0
+    halfwidth = math.inf
+    stop_reason = "max_permutations"
+
+    while 2 * pairs < max_permutations:
+        order = rng.permutation(n)
+        value.prefetch(_prefixes(order) + _prefixes(order[::-1]))
+        try:
+            # A pair is kept only if both halves fit the budget, so the sample stays balanced
+            sample = (_marginals(order, value) + _marginals(order[::-1], value)) / 2
+        except BudgetExhausted:
+            stop_reason = "budget"
+            break
+        total += sample
+        total_sq += sample ** 2
+        pairs += 1
+
+        if pairs >= 2 and 2 * pairs >= min_permutations:
+            mean = total / pairs
+            variance = np.maximum(total_sq / pairs - mean ** 2, 0.0) * pairs / (pairs - 1)
+            halfwidth = float(np.max(SHAP_CONFIDENCE_Z * np.sqrt(variance / pairs)))
+            if halfwidth <= tolerance:
+                stop_reason = "converged"
+                break
+
+    return baseline, total / pairs, _cost(value, n, 2 * pairs, stop_reason, halfwidth)
+
+
+def _cost(value, n, permutations, stop_reason, halfwidth):
+    return {
+        "estimator": "permutation",
+        "chunks": n,
+        "llm_calls": value.calls,
+        "coalition_cache_hits": value.hits,
+        "permutations": permutations,
+        "stop_reason": stop_reason,
+        "max_ci_halfwidth": round(halfwidth, 6) if math.isfinite(halfwidth) else None,
+    }
@@ -1,27 +1,176 @@
+import os
+import threading
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 
+# Per-answer metrics are one-row batches, so live scoring and re-scoring
+# share a single formula per metric.
+
 def faithfulness(shap_vals):
-    
-    if(np.sum(np.abs(shap_vals)) == 0):
-        return 0
-    
-    return float(np.sum(shap_vals) / np.sum(np.abs(shap_vals)))
+    return float(batch_faithfulness(*pad_shap([shap_vals]))[0])
 
 
 def context_precision(shap_vals, threshold=0.05):
-    
-    if len(shap_vals) == 0:
-        return 0
-    
-    return float((shap_vals > threshold).sum() / len(shap_vals))
+    return float(batch_context_precision(*pad_shap([shap_vals]), threshold=threshold)[0])
 
 
 def context_recall(shap_vals, top_k=3):
-    
-    sorted_vals = np.sort(shap_vals)[::-1]
-    
-    if sorted_vals.sum() == 0:
-        return 0
-    
-    return float(sorted_vals[:top_k].sum() / sorted_vals.sum())
+    return float(batch_context_recall(*pad_shap([shap_vals]), top_k=top_k)[0])
+
+
+# Batched scoring -------------------
+#
+# Every metric fetch_score reports, for many answers at once (one answer is a
+# batch of one). SHAP vectors have one value per KB chunk, so the batch is
+# ragged: rows are zero-padded to the longest vector and `lengths` says how
+# many values of each row are real.
+
+METRICS_POOL_WORKERS = int(os.getenv("METRICS_POOL_WORKERS", 0))
+METRICS_SHARD_SIZE = int(os.getenv("METRICS_SHARD_SIZE", 5000))
+
+BATCH_METRICS = (
+    "faithfulness", "context_precision", "context_recall",
+    "Robustness", "Biasness", "Resilience", "Accuracy",
+)
+
+
+def pad_shap(shap_lists):
+    """
+    Ragged list of SHAP vectors -> (padded float64 matrix, int64 lengths).
+    """
+    lengths = np.fromiter((len(v) for v in shap_lists), dtype=np.int64, count=len(shap_lists))
+    padded = np.zeros((len(shap_lists), int(lengths.max()) if len(lengths) else 0), dtype=np.float64)
+    for row, values in enumerate(shap_lists):
+        padded[row, :len(values)] = values
+    return padded, lengths
+
+
+def _valid_mask(padded, lengths):
+    return np.arange(padded.shape[1]) < lengths[:, None]
+
+
+def _safe_divide(numerator, denominator):
+    out = np.zeros_like(numerator, dtype=np.float64)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out
+
+
+def batch_faithfulness(padded, lengths):
+    # Padding is zero, so it adds nothing to either sum
+    return _safe_divide(padded.sum(axis=1), np.abs(padded).sum(axis=1))
+
+
+def batch_context_precision(padded, lengths, threshold=0.05):
+    above = (padded > threshold) & _valid_mask(padded, lengths)
+    return _safe_divide(above.sum(axis=1).astype(np.float64), lengths.astype(np.float64))
+
+
+def batch_context_recall(padded, lengths, top_k=3):
+    mask = _valid_mask(padded, lengths)
+    # Padding sorts last so it never displaces a real (possibly negative) value from the top k
+    ranked = -np.sort(-np.where(mask, padded, -np.inf), axis=1)
+    ranked[~mask] = 0.0
+    return _safe_divide(ranked[:, :top_k].sum(axis=1), ranked.sum(axis=1))
+
+
+def _batch_simple_metrics(padded, lengths, mask, recall):
+    """
+    Vectorised compute_simple_metrics (scoring_pipeline): robustness, bias,
+    resilience and accuracy proxy, as percentages. Rows must have length >= 1.
+    """
+    n = lengths.astype(np.float64)
+
+    mean = padded.sum(axis=1) / n
+    deviation = np.where(mask, padded - mean[:, None], 0.0)
+    robustness = 1 / (1 + np.sqrt((deviation ** 2).sum(axis=1) / n)) * 100
+
+    shap_abs = np.abs(padded)
+    abs_total = shap_abs.sum(axis=1)
+    share = _safe_divide(shap_abs, abs_total[:, None])
+    entropy = -(share * np.log(share + 1e-10)).sum(axis=1)
+    max_entropy = np.log(n)
+    fairness = _safe_divide(entropy, max_entropy) * 100
+    bias = np.where(abs_total > 0, 100 - fairness, 100.0)
+
+    # Sorted descending, padding (zeros) last; cumsum then equals the per-row cumsum
+    sorted_abs = -np.sort(-shap_abs, axis=1)
+    cumulative = np.cumsum(sorted_abs, axis=1)
+    total = cumulative[np.arange(len(lengths)), lengths - 1]
+    reached = (cumulative >= 0.8 * total[:, None]) & mask
+    resilience = np.where(total > 0, (1.0 - reached.sum(axis=1) / n) * 100, 100.0)
+
+    return robustness, bias, resilience, recall * 100
+
+
+def batch_metrics(padded, lengths):
+    """
+    Every metric for every row in one vectorised pass.
+    Returns {metric name: float64 array}, names as in fetch_score().
+    """
+    padded = np.asarray(padded, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    mask = _valid_mask(padded, lengths)
+    recall = batch_context_recall(padded, lengths)
+    robustness, bias, resilience, accuracy = _batch_simple_metrics(padded, lengths, mask, recall)
+    return {
+        "faithfulness": batch_faithfulness(padded, lengths),
+        "context_precision": batch_context_precision(padded, lengths),
+        "context_recall": recall,
+        "Robustness": robustness,
+        "Biasness": bias,
+        "Resilience": resilience,
+        "Accuracy": accuracy,
+    }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor
+
+
+def score_batch(padded, lengths, workers=METRICS_POOL_WORKERS, shard_size=METRICS_SHARD_SIZE):
+    """
+    batch_metrics(), sharded across a process pool when `workers` > 0 and the
+    batch is larger than one shard.
+    """
+    padded = np.asarray(padded, dtype=np.float64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if workers <= 0 or len(lengths) <= shard_size:
+        return batch_metrics(padded, lengths)
+
+    bounds = range(0, len(lengths), shard_size)
+    shards = _get_executor(workers).map(
+        batch_metrics,
+        [padded[start:start + shard_size] for start in bounds],
+        [lengths[start:start + shard_size] for start in bounds],
+    )
+    shards = list(shards)
+    return {name: np.concatenate([shard[name] for shard in shards]) for name in BATCH_METRICS}
+
+
+def metrics_rows(batch):
+    """
+    Batch result -> one dict per answer, rounded exactly like fetch_score().
+    """
+    rows = []
+    columns = [(name, 3 if name[0].islower() else 1, batch[name].tolist()) for name in BATCH_METRICS]
+    for index in range(len(columns[0][2])):
+        rows.append({name: round(values[index], digits) for name, digits, values in columns})
+    return rows
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,73 @@
+import os
+import re
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Cheap checks that run before any LLM-backed scoring.
+#
+# Answers that are empty, an error message or a refusal carry no claims for
+# the KB to support, so they get the no-evidence scores without retrieval or
+# SHAP. For the rest, chunks that share almost no content words with the
+# answer cannot support it; they are not scored and get zero attribution.
+
+SCORE_PRECLASSIFIER = os.getenv("SCORE_PRECLASSIFIER", "1") == "1"
+SCORE_MIN_LEXICAL_OVERLAP = float(os.getenv("SCORE_MIN_LEXICAL_OVERLAP", 0.1))
+# Error / refusal phrases only count in answers this short; a long answer that
+# mentions an error is still an answer
+SHORT_ANSWER_WORDS = int(os.getenv("SHORT_ANSWER_WORDS", 40))
+
+ERROR_PATTERN = re.compile(
+    r"^\W*(error|exception|traceback|internal server error|bad gateway|service unavailable"
+    r"|request (failed|timed out)|timeout|\d{3} (error|client error|server error))\b",
+    re.IGNORECASE,
+)
+REFUSAL_PATTERN = re.compile(
+    r"\b(i('| a)m sorry|i apologi[sz]e|i (can(no|')t|am unable to|am not able to) (help|assist|answer|provide)"
+    r"|i do(n'| no)t (know|have (enough )?information)|as an ai( language model)?|no (relevant )?information (is )?available)\b",
+    re.IGNORECASE,
+)
+
+STOPWORDS = frozenset("""
+    a an and are as at be been but by can could did do does for from had has have he her his i if in into is it its
+    may might no not of on or our she should so than that the their them then there these they this those to too
+    was we were what when where which who will with would you your
+""".split())
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:['.-][a-z0-9]+)*")
+
+
+def classify_answer(agent_answer):
+    """
+    Returns "empty", "error" or "refusal" for answers not worth scoring, else None.
+    """
+    text = (agent_answer or "").strip()
+    if not text:
+        return "empty"
+    if len(text.split()) > SHORT_ANSWER_WORDS:
+        return None
+    if ERROR_PATTERN.search(text):
+        return "error"
+    if REFUSAL_PATTERN.search(text):
+        return "refusal"
+    return None
+
+
+def content_words(text):
+    return {word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS}
+
+
+def lexical_overlap(answer_words, chunk):
+    """
+    Share of the answer's content words that appear in the chunk.
+    """
+    if not answer_words:
+        return 0.0
+    return len(answer_words & content_words(chunk)) / len(answer_words)
+
+
+def relevant_positions(agent_answer, kb_chunks, threshold=SCORE_MIN_LEXICAL_OVERLAP):
+    answer_words = content_words(agent_answer)
+    if not answer_words:
+        # Nothing to compare ("Yes.", a bare number): let SHAP decide
+        return list(range(len(kb_chunks)))
+    return [i for i, chunk in enumerate(kb_chunks) if lexical_overlap(answer_words, chunk) >= threshold]
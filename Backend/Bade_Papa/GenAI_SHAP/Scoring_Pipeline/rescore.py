@@ -0,0 +1,74 @@
+import sqlalchemy as sql
+
+from ....Model import AIQTF_DB as sys_db
+from ..Score_Criteria import score_metrics
+from ..SHAP.genai_shap import shap_from_similarities
+from .scoring_pipeline import no_evidence_scores
+
+# Offline re-scoring: recompute every metric of past runs from the stored
+# scoring artifacts (no agent, retrieval or LLM calls) and write the new
+# values back to evaluation_results. Artifacts are streamed in id order one
+# batch at a time and each batch is scored in a single vectorised pass.
+
+
+def _current_metrics(rows):
+    table = sys_db.evaluation_result_table
+    keys = [(row.run_id, row.case_index) for row in rows]
+    columns = [table.c[column] for column in sys_db.RESULT_METRIC_COLUMNS.values()]
+    query = sql.select(table.c.run_id, table.c.case_index, *columns).where(
+        sql.tuple_(table.c.run_id, table.c.case_index).in_(keys)
+    )
+    with sys_db.transaction() as conn:
+        return {
+            (row.run_id, row.case_index): {
+                key: row._mapping[column] for key, column in sys_db.RESULT_METRIC_COLUMNS.items()
+            }
+            for row in conn.execute(query)
+        }
+
+
+def score_artifacts(rows, workers=score_metrics.METRICS_POOL_WORKERS):
+    """
+    Artifact rows -> one fetch_score()-shaped dict per row, in order.
+    """
+    scores = [None] * len(rows)
+    with_evidence = []
+    shap_lists = []
+    for index, row in enumerate(rows):
+        similarities = sys_db.unpack_similarities(row.chunk_similarities)
+        if len(similarities) == 0 or row.baseline_similarity is None:
+            scores[index] = no_evidence_scores()
+        else:
+            with_evidence.append(index)
+            shap_lists.append(shap_from_similarities(row.baseline_similarity, similarities))
+
+    if shap_lists:
+        padded, lengths = score_metrics.pad_shap(shap_lists)
+        batch = score_metrics.score_batch(padded, lengths, workers=workers)
+        for index, score in zip(with_evidence, score_metrics.metrics_rows(batch)):
+            scores[index] = score
+    return scores
+
+
+def rescore(run_id=None, dry_run=False, batch_size=sys_db.RESULTS_BATCH_SIZE, workers=score_metrics.METRICS_POOL_WORKERS):
+    """
+    Re-score every stored case (or one run's). Returns how many cases were
+    scored and how many of them changed; dry_run reports without writing.
+    """
+    summary = {"cases": 0, "changed": 0, "runs": 0, "dry_run": dry_run}
+    runs = set()
+    for rows in sys_db.stream_scoring_artifacts(run_id, batch_size):
+        current = _current_metrics(rows)
+        updates = []
+        for row, score in zip(rows, score_artifacts(rows, workers)):
+            params = sys_db.metric_update_params(row.run_id, row.case_index, score)
+            summary["cases"] += 1
+            runs.add(row.run_id)
+            before = current.get((row.run_id, row.case_index))
+            if before is not None and any(before[key] != params[f"new_{column}"] for key, column in sys_db.RESULT_METRIC_COLUMNS.items()):
+                summary["changed"] += 1
+                updates.append(params)
+        if not dry_run:
+            sys_db.update_result_metrics(updates)
+    summary["runs"] = len(runs)
+    return summary
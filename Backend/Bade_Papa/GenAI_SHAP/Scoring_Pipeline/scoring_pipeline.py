@@ -1,25 +1,18 @@
 import os
 import numpy as np
-import httpx
 import urllib3
 import requests
-import tiktoken
+from functools import lru_cache
 from dotenv import load_dotenv
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings, AzureOpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
 
-import requests
-
-from ..SHAP.genai_shap import compute_genai_shap
-from ..Score_Criteria.score_metrics import faithfulness, context_precision, context_recall
+from ..SHAP.genai_shap import compute_similarities, shap_from_similarities
+from ..Score_Criteria import score_metrics
+from . import pre_classifier
 
 load_dotenv()
 
 Vector_DB_Path = r"I:\Hackathon Rework\Friday Hackathon\Backend\Resources\equipment_index.faiss"
 
-client = httpx.Client(verify=False)
-
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 os.environ["CURL_CA_BUNDLE"] = ""
@@ -33,27 +26,31 @@ def _patched_request(self, method, url, **kwargs):
 
 requests.Session.request = _patched_request
 
-http_client = httpx.Client(verify=False)
+@lru_cache(maxsize=1)
+def get_embedding_model():
+    # Only the (disabled) local vector store path needs this; build it on demand
+    from langchain_openai import AzureOpenAIEmbeddings
 
-embedding_model = AzureOpenAIEmbeddings(
-    model="text-embedding-3-large",
-    dimensions=1536,
-    api_version="2023-05-15",
-    azure_endpoint="https://oraon-mkwbdbz8-eastus2.cognitiveservices.azure.com/openai/deployments/text-embedding-3-large/embeddings?api-version=2023-05-15",
-    api_key="EcWUgCVMSBvtNSMqWlYyxdsvXUSuBIHpGkMaoxYWdKYpshDn72uMJQQJ99CAACHYHv6XJ3w3AAAAACOGz8ml"
-)
+    return AzureOpenAIEmbeddings(
+        model="text-embedding-3-large",
+        dimensions=1536,
+        api_version="2023-05-15",
+        azure_endpoint="https://oraon-mkwbdbz8-eastus2.cognitiveservices.azure.com/openai/deployments/text-embedding-3-large/embeddings?api-version=2023-05-15",
+        api_key="EcWUgCVMSBvtNSMqWlYyxdsvXUSuBIHpGkMaoxYWdKYpshDn72uMJQQJ99CAACHYHv6XJ3w3AAAAACOGz8ml"
+    )
 
 
+# from langchain_chroma import Chroma
 # VECTOR_DBS = {
 #     "langchain": Chroma(
 #         collection_name="langchain",
 #         persist_directory=Vector_DB_Path,
-#         embedding_function=embedding_model
+#         embedding_function=get_embedding_model()
 #     ),
 #     "equipmentlist": Chroma(
 #         collection_name="equipmentlist",
 #         persist_directory=Vector_DB_Path,
-#         embedding_function=embedding_model
+#         embedding_function=get_embedding_model()
 #     )
 # }
 
@@ -150,60 +147,48 @@ def get_chunks(bot_response:str):
     return out_response
 
 
+def score_shap(shap_vals):
+    """
+    All metrics of one answer from its SHAP values. Same vectorised formulas
+    (score_metrics.batch_metrics) as offline re-scoring, so the two can't drift.
+    """
+    return score_metrics.metrics_rows(score_metrics.batch_metrics(*score_metrics.pad_shap([shap_vals])))[0]
+
+
 def compute_simple_metrics(shap_vals, agent_answer, kb_chunks):
     """
     Simplified metrics that don't require regenerating answers
     Returns metrics as percentages (0-100%)
     """
-    shap_values = np.array(shap_vals)
-    
-    # 1. Robustness (based on SHAP value stability)
-    shap_std = np.std(shap_values)
-    robustness = float(1 / (1 + shap_std)) * 100  # Convert to percentage
-    
-    # 2. Bias (based on SHAP distribution) - convert to fairness percentage
-    shap_abs = np.abs(shap_values)
-    if shap_abs.sum() > 0:
-        shap_abs = shap_abs / shap_abs.sum()
-        entropy = -np.sum(shap_abs * np.log(shap_abs + 1e-10))
-        max_entropy = np.log(len(shap_values))
-        normalized_entropy = entropy / max_entropy if max_entropy > 0 else 0
-        fairness = float(normalized_entropy) * 100  # Fairness as percentage
-        bias = 100 - fairness  # Bias percentage (lower is better)
-    else:
-        bias = 100.0  # Maximum bias when no distribution
-    
-    # 3. Resilience (based on importance concentration) as percentage
-    top_k_ratio = 0.8
-    sorted_abs = np.sort(np.abs(shap_values))[::-1]
-    cumulative = np.cumsum(sorted_abs)
-    total = float(cumulative[-1]) if len(cumulative) > 0 else 0.0
-    
-    if total > 0:
-        k = np.where(cumulative >= top_k_ratio * total)[0]
-        if len(k) > 0:
-            resilience = (1.0 - (float(len(k)) / len(shap_values))) * 100
-        else:
-            resilience = 100.0  # Perfect resilience
-    else:
-        resilience = 100.0  # Perfect resilience
-    
-    # 4. Accuracy proxy (using context recall as indicator) as percentage
-    accuracy_proxy = float(context_recall(shap_vals)) * 100
-    
-    return {
-        "Robustness": round(robustness, 1),  # Round to 1 decimal
-        "Biasness": round(bias, 1),
-        "Resilience": round(resilience, 1),
-        "Accuracy": round(accuracy_proxy, 1)
-    }
+    scores = score_shap(shap_vals)
+    return {name: scores[name] for name in ("Robustness", "Biasness", "Resilience", "Accuracy")}
     
 
 def fetch_score(agent_response: str):
+    return fetch_score_with_artifacts(agent_response)[0]
+
+
+def fetch_score_with_artifacts(agent_response: str):
+    """
+    fetch_score() plus the raw artifacts it was computed from (bot response,
+    KB chunks, per-chunk and baseline similarities), enough to re-score offline.
+    """
 
     agent_answer = agent_response
     # print("Agent Answer:", agent_answer)
 
+    # Step 0: Empty / error / refusal answers have nothing to attribute
+    answer_class = pre_classifier.classify_answer(agent_answer) if pre_classifier.SCORE_PRECLASSIFIER else None
+    if answer_class is not None:
+        print("Scoring path: ", answer_class)
+        return no_evidence_scores(), {
+            "bot_response": agent_answer,
+            "kb_chunks": [],
+            "chunk_similarities": np.array([]),
+            "baseline_similarity": None,
+            "shap_cost": {"path": answer_class, "llm_calls": 0},
+        }
+
     # Step 1: Retrieve KB FIRST
     # kb_chunks = retrieve_top_k_chunks(agent_answer)
     
@@ -215,32 +200,64 @@ def fetch_score(agent_response: str):
     
     
 
+    artifacts = {
+        "bot_response": agent_answer,
+        "kb_chunks": kb_chunks or [],
+        "chunk_similarities": np.array([]),
+        "baseline_similarity": None,
+        "shap_cost": None,
+    }
+
     # Step 2: If no KB found, return zero scores
     if not kb_chunks:
-        return {
-            "faithfulness": 0.0,
-            "context_precision": 0.0,
-            "context_recall": 0.0,
-        }
+        print("Scoring path: ", "no_evidence")
+        artifacts["shap_cost"] = {"path": "no_evidence", "llm_calls": 0}
+        return no_evidence_scores(), artifacts
+
+    # Chunks sharing (almost) no content words with the answer are not scored
+    if pre_classifier.SCORE_PRECLASSIFIER:
+        relevant = pre_classifier.relevant_positions(agent_answer, kb_chunks)
+    else:
+        relevant = list(range(len(kb_chunks)))
+    if not relevant:
+        print("Scoring path: ", "irrelevant_chunks")
+        artifacts["shap_cost"] = {"path": "irrelevant_chunks", "llm_calls": 0, "skipped_chunks": len(kb_chunks)}
+        return no_evidence_scores(), artifacts
 
     # Step 3: Compute SHAP with KB
-    shap_vals, na = compute_genai_shap(kb_chunks, agent_answer)
+    baseline, relevant_similarities, shap_tokens, shap_cost = compute_similarities(
+        [kb_chunks[i] for i in relevant], agent_answer
+    )
+    # Skipped chunks sit at the baseline, i.e. zero attribution
+    similarities = np.full(len(kb_chunks), baseline, dtype=np.float64)
+    similarities[relevant] = relevant_similarities
+    shap_cost["path"] = "shap" if len(relevant) == len(kb_chunks) else "shap_partial"
+    shap_cost["skipped_chunks"] = len(kb_chunks) - len(relevant)
+    print("Scoring path: ", shap_cost["path"])
+    artifacts["chunk_similarities"] = similarities
+    artifacts["baseline_similarity"] = baseline
+    artifacts["shap_cost"] = shap_cost
+    shap_vals = shap_from_similarities(baseline, similarities)
 
     
 
     print("SHAP values:", shap_vals)
 
     # Step 4: Metrics
-    results = {
-        "faithfulness": round(faithfulness(shap_vals), 3),
-        "context_precision": round(context_precision(shap_vals), 3),
-        "context_recall": round(context_recall(shap_vals), 3),
-    }
-    
-    simple_new_metrics = compute_simple_metrics(shap_vals, agent_answer, kb_chunks)
-    results.update(simple_new_metrics)
+    results = score_shap(shap_vals)
 
-    return results
+    return results, artifacts
+
+
+def no_evidence_scores():
+    # Robustness / Biasness / Resilience / Accuracy describe an attribution and
+    # are left out, not zeroed (zero bias would read as perfectly unbiased);
+    # run averages are taken over the cases that have each metric
+    return {
+        "faithfulness": 0.0,
+        "context_precision": 0.0,
+        "context_recall": 0.0,
+    }
 
 
 # def fetch_score(agent_response: str):
@@ -1,10 +1,20 @@
 from ..Model import AIQTF_DB as sys_db
+from ..Model import AIQTF_DB_async as async_db
+from ..Model import results_export
 from ..Auth import auth as auth
 from ..LLM_Model import testcase_gen as tgen
+from ..LLM_Model import llm_gateway
 from ..Bade_Papa.GenAI_SHAP.Scoring_Pipeline import scoring_pipeline as evaluate
+from ..Bade_Papa.GenAI_SHAP.Scoring_Pipeline import rescore
+from ..Bade_Papa.GenAI_SHAP.SHAP import coalition_cache
+from ..Scheduler import evaluation_scheduler
+from ..Scheduler import job_queue
+from ..Load_Test import load_generator
+from ..Model import shared_cache
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, BinaryIO, Any
 from typing_extensions import Annotated
@@ -15,6 +25,9 @@ import numpy as np
 import requests
 
 import json
+import time
+import uuid
+import asyncio
 
 app = FastAPI()
 
@@ -24,11 +37,32 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Failed evaluations name their run here so the client can resume it
+    expose_headers=["X-Run-Id"],
 )
 
 app.include_router(router=auth.router, prefix="/auth" )
 
 
+@app.on_event("startup")
+def init_database():
+    # Schema is created once per worker instead of on every query
+    sys_db.init_db()
+
+
+@app.on_event("startup")
+def start_job_consumers():
+    # Multi-worker mode: every worker process consumes the shared evaluation queue
+    if job_queue.EVAL_DISPATCH == "queue":
+        job_queue.start_consumers(run_queued_job)
+
+
+@app.on_event("shutdown")
+async def close_database():
+    job_queue.stop_consumers()
+    await async_db.dispose()
+
+
 class Test_Scenario(BaseModel):
 
     name: str = Field(..., min_length=1, max_length=100, description="Scenario name")
@@ -82,9 +116,51 @@ class AgentModelBase(BaseModel):
     )
 
 
+# Listing defaults: the fields each listing returned before projection was supported
+SCENARIO_LIST_FIELDS = ["id", "name", "description", "agent_name", "agent_endpoint", "agent_model", "created_at", "tags", "benchmark", "latency_benchmark_ms", "latency_p95_ms"]
+TEST_SUIT_LIST_FIELDS = ["id", "scenario_id", "name", "description", "jira_link", "test_dimensions", "created_at", "selected_test_cases", "type"]
+
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 500
+
+
+def page_limit(limit: Optional[int], cursor: Optional[str]):
+    # No limit and no cursor: the full listing, as before pagination (the
+    # frontend doesn't follow next_cursor). A cursor alone pages at the default size.
+    if limit is None and cursor:
+        return PAGE_SIZE_DEFAULT
+    return limit
+
+
+def parse_fields(fields: Optional[str], default: Optional[List[str]] = None):
+    # "?fields=id,name" -> ["id", "name"]
+    if not fields:
+        return default
+    return [f.strip() for f in fields.split(",") if f.strip()]
+
+
+def require_admin(request: Request):
+    """
+    (username, role) of an admin caller; 401 without a valid access token, 403 for other roles.
+    """
+    user, role = auth.request_identity(request)
+    if role == "anonymous":
+        raise HTTPException(status_code=401, detail="authorization header missing or invalid")
+    if role != "admin":
+        raise HTTPException(status_code=403, detail="forbidden: admin required")
+    return user, role
+
+
+def row_to_dict(row):
+    return {
+        key: (str(value) if isinstance(value, datetime) else value)
+        for key, value in row._mapping.items()
+    }
+
+
 # Scenario Endpoints
 @app.post("/scenarios/", tags=["Scenarios"])
-def create_scenario(
+async def create_scenario(
     name: str,
     description: str,
     agent_name: str,
@@ -94,14 +170,16 @@ def create_scenario(
     benchmark: Optional[List[float]] = None,
     dimensions:Optional[List[str]] = None,
     analysis_score:Optional[List[float]] = None,
-    overall_score:Optional[float] = None
+    overall_score:Optional[float] = None,
+    latency_benchmark_ms:Optional[float] = None,
+    latency_p95_ms:Optional[float] = None
     
 ):
     """
     Create a new scenario
     """
     try:
-        scenario_id = sys_db.insert_scenario(
+        scenario_id = await async_db.insert_scenario(
             name=name,
             description=description,
             agent_name=agent_name,
@@ -111,7 +189,9 @@ def create_scenario(
             benchmark=benchmark,
             dimensions=dimensions,
             analysis_score=analysis_score,
-            overall_score=overall_score
+            overall_score=overall_score,
+            latency_benchmark_ms=latency_benchmark_ms,
+            latency_p95_ms=latency_p95_ms
             
         )
         return {
@@ -122,40 +202,47 @@ def create_scenario(
         raise HTTPException(status_code=500, detail=f"Error creating scenario: {str(e)}")
 
 @app.get("/scenarios/", tags=["Scenarios"])
-def get_all_scenarios():
+async def get_all_scenarios(
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    name: Optional[str] = None,
+    tags: Optional[List[str]] = Query(None),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None
+):
     """
-    Get all scenarios
+    Get scenarios, newest first: all of them, or one page at a time with `limit`.
+    Pass the returned next_cursor back as `cursor` to fetch the following page.
     """
     try:
-        result = sys_db.fetch_all_scenarios()
-        scenarios_list = []
-        for row in result:
-            scenario = {
-                "id": row.id,
-                "name": row.name,
-                "description": row.description,
-                "agent_name": row.agent_name,
-                "agent_endpoint": row.agent_endpoint,
-                "agent_model": row.agent_model,
-                "created_at": str(row.created_at) if row.created_at else None,
-                "tags": row.tags,
-                "benchmark": row.benchmark
-            }
-            scenarios_list.append(scenario)
+        result, next_cursor = await async_db.fetch_scenarios_page(
+            page_limit(limit, cursor),
+            cursor=cursor,
+            fields=parse_fields(fields, SCENARIO_LIST_FIELDS),
+            name=name,
+            tags=tags,
+            created_after=created_after,
+            created_before=created_before
+        )
+        scenarios_list = [row_to_dict(row) for row in result]
         return {
             "scenarios": scenarios_list,
-            "count": len(scenarios_list)
+            "count": len(scenarios_list),
+            "next_cursor": next_cursor
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching scenarios: {str(e)}")
 
 @app.get("/scenarios/{scenario_id}", tags=["Scenarios"])
-def get_scenario_by_id(scenario_id: int, scenario_name: Optional[str] = None):
+async def get_scenario_by_id(scenario_id: int, scenario_name: Optional[str] = None):
     """
     Get scenario by ID with optional name filter
     """
     try:
-        result = sys_db.fetch_scenario_by_id(scenario_id, scenario_name)
+        result = await async_db.fetch_scenario_by_id(scenario_id, scenario_name)
         if result is None:
             raise HTTPException(status_code=404, detail="Scenario not found")
         
@@ -168,7 +255,10 @@ def get_scenario_by_id(scenario_id: int, scenario_name: Optional[str] = None):
             "agent_model": result.agent_model,
             "created_at": str(result.created_at) if result.created_at else None,
             "tags": result.tags,
-            "benchmark": result.benchmark
+            "benchmark": result.benchmark,
+            "latency_benchmark_ms": result.latency_benchmark_ms,
+            "latency_p95_ms": result.latency_p95_ms,
+            "latency_passed": latency_passed(result.latency_benchmark_ms, result.latency_p95_ms)
         }
         return {"scenario": scenario}
     except HTTPException:
@@ -176,9 +266,147 @@ def get_scenario_by_id(scenario_id: int, scenario_name: Optional[str] = None):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching scenario: {str(e)}")
 
+
+def scenario_test_cases(scenario_id):
+    return [
+        test_case
+        for suit in sys_db.fetch_test_suits_by_scenario(scenario_id)
+        for test_case in (suit.selected_test_cases or [])
+        if test_case
+    ]
+
+
+# Load tests run after the request returns; keep a reference so they aren't garbage collected
+load_test_tasks = set()
+
+
+def run_queued_load_test(payload):
+    """
+    Job handler for a load test under EVAL_DISPATCH=queue. Runs in a consumer
+    thread, which has no event loop of its own.
+    """
+    sys_db.update_load_test(payload["load_test_id"], status=sys_db.RUN_RUNNING)
+    return asyncio.run(load_generator.run_load_test(
+        payload["agent_endpoint"], payload["test_cases"], max_requests=payload["max_requests"], **payload["load"]
+    ))
+
+
+async def run_load_test_job(load_test_id, user, role, agent_endpoint, test_cases, max_requests, load):
+    """
+    Run a load test under the same admission control as evaluations: it
+    counts as one run against the caller's and the agent endpoint's quota.
+    """
+    try:
+        if job_queue.EVAL_DISPATCH == "queue":
+            payload = {
+                "kind": "load_test",
+                "load_test_id": load_test_id,
+                "agent_endpoint": agent_endpoint,
+                "test_cases": test_cases,
+                "max_requests": max_requests,
+                "load": load,
+            }
+            report = await job_queue.run(f"load-test-{load_test_id}", user, role, agent_endpoint, payload)
+        else:
+            async with evaluation_scheduler.scheduler.slot(user, role, agent_endpoint):
+                await run_in_threadpool(sys_db.update_load_test, load_test_id, status=sys_db.RUN_RUNNING)
+                report = await load_generator.run_load_test(agent_endpoint, test_cases, max_requests=max_requests, **load)
+        await run_in_threadpool(sys_db.complete_load_test, load_test_id, report)
+    except Exception as e:
+        print(f"Load test {load_test_id} failed: {e}")
+        await run_in_threadpool(sys_db.update_load_test, load_test_id, status=sys_db.RUN_FAILED, error=str(e))
+
+
+@app.post("/scenarios/{scenario_id}/load-test", tags=["Scenarios"], status_code=202)
+async def run_scenario_load_test(
+    scenario_id: int,
+    request: Request,
+    mode: str = "closed",
+    concurrency: int = 10,
+    duration_seconds: float = 60,
+    ramp_up_seconds: float = 0,
+    arrival_rate: Optional[float] = None,
+    max_requests: Optional[int] = Query(None, ge=1)
+):
+    """
+    Admin only. Queue a load test of the scenario's agent endpoint with its
+    test suits' test cases and return its id; poll
+    GET /scenarios/{scenario_id}/load-tests/{id} for the outcome.
+    mode=closed: `concurrency` users back to back; mode=open: `arrival_rate`
+    requests/s with at most `concurrency` in flight. Ramps up over ramp_up_seconds.
+    """
+    try:
+        user, role = require_admin(request)
+
+        load = {
+            "mode": mode,
+            "concurrency": concurrency,
+            "arrival_rate": arrival_rate,
+            "duration_seconds": duration_seconds,
+            "ramp_up_seconds": ramp_up_seconds,
+        }
+        load_generator.validate(mode, concurrency, duration_seconds, ramp_up_seconds, arrival_rate)
+
+        scenario = await async_db.fetch_scenario_by_id(scenario_id)
+        if scenario is None:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+        test_cases = await run_in_threadpool(scenario_test_cases, scenario_id)
+        if not test_cases:
+            raise HTTPException(status_code=400, detail="Scenario has no selected test cases")
+
+        load_test_id = await run_in_threadpool(
+            sys_db.insert_load_test, scenario_id, scenario.agent_endpoint, user, load
+        )
+        task = asyncio.create_task(run_load_test_job(
+            load_test_id, user, role, scenario.agent_endpoint, test_cases, max_requests, load
+        ))
+        load_test_tasks.add(task)
+        task.add_done_callback(load_test_tasks.discard)
+        return {
+            "id": load_test_id,
+            "scenario_id": scenario_id,
+            "agent_endpoint": scenario.agent_endpoint,
+            "status": sys_db.LOAD_TEST_QUEUED,
+            **load,
+        }
+    
+    except load_generator.LoadTestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error starting load test: {str(e)}")
+
+
+@app.get("/scenarios/{scenario_id}/load-tests/{load_test_id}", tags=["Scenarios"])
+async def get_scenario_load_test(scenario_id: int, load_test_id: int):
+    """
+    Status of a load test and, once completed, its results
+    """
+    try:
+        row = await run_in_threadpool(sys_db.fetch_load_test, scenario_id, load_test_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching load test: {str(e)}")
+    if row is None:
+        raise HTTPException(status_code=404, detail="Load test not found")
+    return {"load_test": row_to_dict(row)}
+
+
+@app.get("/scenarios/{scenario_id}/load-tests", tags=["Scenarios"])
+async def get_scenario_load_tests(scenario_id: int):
+    """
+    Stored load test results of a scenario, newest first
+    """
+    try:
+        rows = await run_in_threadpool(sys_db.fetch_load_test_results, scenario_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching load tests: {str(e)}")
+    results = [row_to_dict(row) for row in rows]
+    return {"scenario_id": scenario_id, "load_tests": results, "count": len(results)}
+
 # Test Suit Endpoints
 @app.post("/test-suits/", tags=["Test Suits"])
-def create_test_suit(
+async def create_test_suit(
     scenario_id: int,
     name: str,
     description: str,
@@ -191,7 +419,7 @@ def create_test_suit(
     Create a new test suit
     """
     try:
-        test_suit_id = sys_db.insert_test_suit(
+        test_suit_id = await async_db.insert_test_suit(
             scenario_id=scenario_id,
             name=name,
             description=description,
@@ -208,40 +436,42 @@ def create_test_suit(
         raise HTTPException(status_code=500, detail=f"Error creating test suit: {str(e)}")
 
 @app.get("/test-suits/", tags=["Test Suits"])
-def get_all_test_suits():
+async def get_all_test_suits(
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    scenario_id: Optional[int] = None,
+    name: Optional[str] = None
+):
     """
-    Get all test suits
+    Get test suits, newest first: all of them, or one page at a time with `limit`
     """
     try:
-        result = sys_db.fetch_all_test_suits()
-        test_suits_list = []
-        for row in result:
-            test_suit = {
-                "id": row.id,
-                "scenario_id": row.scenario_id,
-                "name": row.name,
-                "description": row.description,
-                "jira_link": row.jira_link,
-                "test_dimensions": row.test_dimensions,
-                "created_at": str(row.created_at) if row.created_at else None,
-                "selected_test_cases": row.selected_test_cases,
-                "type": row.type
-            }
-            test_suits_list.append(test_suit)
+        result, next_cursor = await async_db.fetch_test_suits_page(
+            page_limit(limit, cursor),
+            cursor=cursor,
+            fields=parse_fields(fields, TEST_SUIT_LIST_FIELDS),
+            scenario_id=scenario_id,
+            name=name
+        )
+        test_suits_list = [row_to_dict(row) for row in result]
         return {
             "test_suits": test_suits_list,
-            "count": len(test_suits_list)
+            "count": len(test_suits_list),
+            "next_cursor": next_cursor
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching test suits: {str(e)}")
 
 @app.get("/test-suits/scenario/{scenario_id}", tags=["Test Suits"])
-def get_test_suits_by_scenario(scenario_id: int):
+async def get_test_suits_by_scenario(scenario_id: int):
     """
     Get all test suits for a specific scenario
     """
     try:
-        result = sys_db.fetch_test_suits_by_scenario(scenario_id)
+        result = await async_db.fetch_test_suits_by_scenario(scenario_id)
         test_suits_list = []
         for row in result:
             test_suit = {
@@ -252,7 +482,7 @@ def get_test_suits_by_scenario(scenario_id: int):
                 "jira_link": row.jira_link,
                 "test_dimensions": row.test_dimensions,
                 "created_at": str(row.created_at) if row.created_at else None,
-                "document": row.document,
+                "selected_test_cases": row.selected_test_cases,
                 "type": row.type
             }
             test_suits_list.append(test_suit)
@@ -264,12 +494,12 @@ def get_test_suits_by_scenario(scenario_id: int):
         raise HTTPException(status_code=500, detail=f"Error fetching test suits: {str(e)}")
 
 @app.post("/test-suits/{test_suit_id}", tags=["Test Suits"])
-def get_test_suit_by_id(test_suit_id: int):
+async def get_test_suit_by_id(test_suit_id: int):
     """
     Get test suit by ID
     """
     try:
-        result = sys_db.fetch_test_suit_by_id(test_suit_id)
+        result = await async_db.fetch_test_suit_by_id(test_suit_id)
         if result is None:
             raise HTTPException(status_code=404, detail="Test suit not found")
         
@@ -281,7 +511,7 @@ def get_test_suit_by_id(test_suit_id: int):
             "jira_link": result.jira_link,
             "test_dimensions": result.test_dimensions,
             "created_at": str(result.created_at) if result.created_at else None,
-            "document": result.document,
+            "selected_test_cases": result.selected_test_cases,
             "type": result.type
         }
         return {"test_suit": test_suit}
@@ -291,11 +521,11 @@ def get_test_suit_by_id(test_suit_id: int):
         raise HTTPException(status_code=500, detail=f"Error fetching test suit: {str(e)}")
 
 @app.delete("/test-suit/delete/{test_suit_id}", tags=["Test Suits"])
-def delete_test_suit(test_suit_id:int):
+async def delete_test_suit(test_suit_id:int):
     
     try:
         
-        result = sys_db.delete_test_suit(test_suit_id)
+        await async_db.delete_test_suit(test_suit_id)
         
         return {
             "response": "Test Suit Deleted."
@@ -307,12 +537,12 @@ def delete_test_suit(test_suit_id:int):
 
 # Agent Endpoints
 @app.post("/agents/", tags=["Agents"])
-def create_agent(agent : AgentModelBase):
+async def create_agent(agent : AgentModelBase):
     """
     Create a new agent configuration
     """
     try:
-        agent_id = sys_db.insert_agent(
+        agent_id = await async_db.insert_agent(
             model_provider=agent.model_provider,
             model_name=agent.model_name,
             api_version=agent.api_version,
@@ -328,35 +558,35 @@ def create_agent(agent : AgentModelBase):
         raise HTTPException(status_code=500, detail=f"Error creating agent: {str(e)}")
 
 @app.get("/agents/", tags=["Agents"])
-def get_all_agents():
+async def get_all_agents(
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
     """
-    Get all agent configurations
+    Get agent configurations, newest first: all of them, or one page at a time with `limit`
     """
     try:
-        result = sys_db.fetch_all_agents()
-        agents_list = []
-        for row in result:
-            agent = {
-                "id": row.id,
-                "model_provider": row.model_provider,
-                "model_name": row.model_name,
-                "api_version": row.api_version,
-                "api_endpoint": row.api_endpoint,
-                "api_key": row.api_key,
-                "description": row.description
-            }
-            agents_list.append(agent)
+        result, next_cursor = await async_db.fetch_agents_page(
+            page_limit(limit, cursor),
+            cursor=cursor,
+            fields=parse_fields(fields)
+        )
+        agents_list = [row_to_dict(row) for row in result]
         return {
             "agents": agents_list,
-            "count": len(agents_list)
+            "count": len(agents_list),
+            "next_cursor": next_cursor
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching model: {str(e)}")
 
 @app.post("/agent/", tags=["Agents"])
-def get_agent_by_id(id):
+async def get_agent_by_id(id: int):
     try:
-        model = sys_db.fetch_agent_by_id(id)
+        model = await async_db.fetch_agent_by_id(id)
         if(model):
             agent = {
                 "id": model.id,
@@ -375,12 +605,12 @@ def get_agent_by_id(id):
         
 
 @app.delete("/agents/", tags=["Agents"])
-def delete_agent(id):
+async def delete_agent(id: int):
     try:
-        model = sys_db.fetch_agent_by_id(id) 
+        model = await async_db.fetch_agent_by_id(id) 
         
         if(model):
-            sys_db.delete_selected_agent(id)
+            await async_db.delete_selected_agent(id)
             return {
                 "response": "Model Deleted",
                 "model": model.model_name +" ( "+ model.model_provider + " )"
@@ -392,18 +622,292 @@ def delete_agent(id):
         raise HTTPException(status_code=500, detail=f"Error fetching model: {str(e)}")
     
     
+AGENT_URL = "http://127.0.0.1:8448/response"
+
+# Agent speed is a benchmark dimension. The step3 Latency entry's `target` is
+# the UI's percentage (1-100); the p95 end-to-end agent latency the scenario
+# must meet comes from its separate `targetMs`: {"dimension": "Latency", "target": 85, "targetMs": 500}
+LATENCY_DIMENSION = "Latency"
+AGENT_LATENCY_PERCENTILES = (50, 95, 99)
+
+
 def get_client_bot_response(test_case:str):
-    
-    url = "http://127.0.0.1:8448/response"
-    params = {"input": f"{test_case}"}
+    return timed_client_bot_response(test_case)[0]
+
 
-    response = requests.post(url, params=params)
+def timed_client_bot_response(test_case:str):
+    """
+    Returns (bot answer, {"agent_ttfb_ms", "agent_latency_ms"}): time until the
+    response headers arrived and until the whole body was read.
+    """
+    url = AGENT_URL
+    params = {"input": f"{test_case}"}
 
+    started = time.perf_counter()
+    # stream=True returns as soon as the headers are in; the body is read by .json()
+    response = requests.post(url, params=params, stream=True)
+    ttfb = time.perf_counter() - started
 
     response_to_json = response.json()
     out_response = response_to_json["message"]
 
-    return out_response
+    timing = {
+        "agent_ttfb_ms": round(ttfb * 1000, 3),
+        "agent_latency_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+    return out_response, timing
+
+
+def latency_report(timings):
+    """
+    Percentiles of the agent's TTFB and total latency over a run's cases, and
+    the agent's throughput over the time spent waiting on it.
+    """
+    report = {}
+    for kind in ("ttfb", "latency"):
+        values = [timing[f"agent_{kind}_ms"] for timing in timings if timing.get(f"agent_{kind}_ms") is not None]
+        for percent in AGENT_LATENCY_PERCENTILES:
+            report[f"agent_{kind}_p{percent}_ms"] = round(float(np.percentile(values, percent)), 3) if values else None
+    totals = [timing["agent_latency_ms"] for timing in timings if timing.get("agent_latency_ms")]
+    report["agent_throughput_rps"] = round(len(totals) / (sum(totals) / 1000), 3) if totals else None
+    return report
+
+
+def latency_passed(latency_benchmark_ms, latency_p95_ms):
+    if latency_benchmark_ms is None or latency_p95_ms is None:
+        return None
+    return latency_p95_ms <= latency_benchmark_ms
+
+
+def latency_target(step3):
+    # Only targetMs is in ms; `target` is a percentage and never read as a latency
+    for benchmark in step3 or []:
+        if benchmark.get("dimension") == LATENCY_DIMENSION and benchmark.get("targetMs") is not None:
+            return float(benchmark["targetMs"])
+    return None
+
+
+def score_test_cases(run_id, test_description, test_dimensions_list, selected_testcases):
+    """
+    Score a run, checkpointing every case, and record whether it completed.
+    Blocking (LLM + agent HTTP calls): run it off the event loop.
+    Returns (per-case scores, token usage report, agent latency report).
+    """
+    try:
+        out_list, tokens, latency = score_run_cases(run_id, test_description, test_dimensions_list, selected_testcases)
+    except Exception as e:
+        sys_db.update_evaluation_run(run_id, status=sys_db.RUN_FAILED, error=str(e))
+        raise
+    sys_db.update_evaluation_run(run_id, status=sys_db.RUN_COMPLETED, error=None)
+    return out_list, tokens, latency
+
+
+def generate_test_cases(test_description, test_dimensions_list, selected_testcases):
+    """
+    Returns ([[dimension, test case], ...], token usage of the generation).
+    """
+    with llm_gateway.track_usage() as generation_usage:
+        response = tgen.generate_testcases(test_description, test_dimensions_list, selected_testcases)
+    
+    # print("Response: ", response)
+    
+    
+    try:
+        test_accuracy = response["Accuracy"] if response["Accuracy"] != None else ""
+    except Exception as e:
+        test_accuracy = ""
+        
+    
+    try:
+        test_Biasness = response["Bias"] if response["Bias"] != None else ""
+    except Exception as e:
+        test_Biasness = ""
+        
+        
+    try:
+        test_Resilience = response["Resilience"] if response["Resilience"] != None else ""
+    except Exception as e:
+        test_Resilience = ""
+        
+        
+    try:
+        test_Robustness = response["Robustness"] if response["Robustness"] != None else ""
+    except Exception as e:
+        test_Robustness = ""
+        
+    
+    test_cases = []
+    test_cases.append(test_accuracy.split(","))
+    test_cases.append(test_Biasness.split(","))
+    test_cases.append(test_Resilience.split(","))
+    test_cases.append(test_Robustness.split(","))
+    
+    test_case_dimensions = ["Accuracy", "Biasness", "Resilience", "Robustness"]
+    
+    print("Test_Accuracy: ", test_accuracy)
+    
+    return [[dimension, test] for dimension, test in zip(test_case_dimensions, test_cases)], generation_usage
+
+
+def score_run_cases(run_id, test_description, test_dimensions_list, selected_testcases):
+    """
+    Query the agent and score every test case of a run, writing each case as
+    soon as it is scored. Test cases generated and cases scored by an earlier
+    attempt of the same run are reused, not paid for again.
+    """
+    run = sys_db.fetch_evaluation_run(run_id)
+    if run is not None and run.test_cases is not None:
+        test_cases, generation_usage = run.test_cases, run.generation_tokens
+    else:
+        test_cases, generation_usage = generate_test_cases(test_description, test_dimensions_list, selected_testcases)
+        sys_db.update_evaluation_run(run_id, test_cases=test_cases, generation_tokens=generation_usage)
+    
+    checkpoints = sys_db.fetch_checkpointed_cases(run_id)
+    if checkpoints:
+        print(f"Resuming run {run_id}: {len(checkpoints)} of {len(test_cases)} cases already scored")
+    
+    out_list = []
+    usage_by_dimension = {}
+    shap_costs = []
+    agent_timings = []
+    
+    for case_index, (dimension, test) in enumerate(test_cases):
+        if case_index in checkpoints:
+            result, shap_cost = checkpoints[case_index]
+            score = sys_db.score_from_result(result)
+            case_usage = {kind: result._mapping[kind] or 0 for kind in llm_gateway.TOKEN_KINDS}
+            agent_timing = {"agent_ttfb_ms": result.agent_ttfb_ms, "agent_latency_ms": result.agent_latency_ms}
+        else:
+            print("TestCase_Prompt: ", test)
+            started = time.perf_counter()
+            bot_response, agent_timing = timed_client_bot_response(test)
+            print("bot_Response: ", bot_response)
+            with llm_gateway.track_usage() as case_usage:
+                score, artifacts = evaluate.fetch_score_with_artifacts(bot_response)
+            # Per-case scores (and what they were computed from) are kept, not just the run averages
+            sys_db.checkpoint_case(
+                sys_db.result_row(
+                    run_id, case_index, dimension, str(test), score,
+                    latency_ms=round((time.perf_counter() - started) * 1000, 3),
+                    tokens=case_usage,
+                    agent_timing=agent_timing
+                ),
+                sys_db.artifact_row(run_id, case_index, artifacts)
+            )
+            shap_cost = artifacts["shap_cost"]
+        out_list.append(score)
+        agent_timings.append(agent_timing)
+        shap_costs.append({"case_index": case_index, "dimension": dimension, **(shap_cost or {"llm_calls": 0})})
+        llm_gateway.add_usage(usage_by_dimension.setdefault(dimension, llm_gateway.empty_usage()), case_usage)
+    
+    return out_list, token_report(generation_usage, usage_by_dimension, shap_costs), latency_report(agent_timings)
+
+
+def token_report(generation_usage, usage_by_dimension, shap_costs):
+    """
+    Token usage of one run: test case generation, scoring per dimension and
+    the run total, plus the attribution cost of each answer.
+    """
+    run_usage = llm_gateway.add_usage(llm_gateway.empty_usage(), generation_usage)
+    for usage in usage_by_dimension.values():
+        llm_gateway.add_usage(run_usage, usage)
+    run_usage["total_tokens"] = llm_gateway.total_tokens(run_usage)
+    return {
+        "generation": generation_usage,
+        "by_dimension": usage_by_dimension,
+        "run": run_usage,
+        "shap_cost": shap_costs,
+    }
+
+
+def run_queued_evaluation(payload):
+    """
+    Job handler for EVAL_DISPATCH=queue: score (checkpointing each case) and
+    hand the scores back to the worker that is serving the request.
+    """
+    out_list, tokens, latency = score_test_cases(
+        payload["run_id"], payload["test_description"], payload["test_dimensions_list"], payload["selected_testcases"]
+    )
+    return {"scores": out_list, "tokens": tokens, "latency": latency}
+
+
+def run_queued_job(payload):
+    # Evaluations and load tests share the queue and its quotas
+    if payload.get("kind") == "load_test":
+        return run_queued_load_test(payload)
+    return run_queued_evaluation(payload)
+
+
+async def dispatch_evaluation(run_id, user, role, agent, run_request):
+    """
+    Score a run in this worker or through the job queue (EVAL_DISPATCH).
+    Returns (per-case scores, token usage report, agent latency report).
+    """
+    try:
+        if job_queue.EVAL_DISPATCH == "queue":
+            # Any worker process may pick the job up
+            result = await job_queue.run(run_id, user, role, agent, {"run_id": run_id, **run_request})
+            return result["scores"], result["tokens"], result["latency"]
+        # Wait for a fair share of evaluation capacity, then score off the event loop
+        async with evaluation_scheduler.scheduler.slot(user, role, agent):
+            return await run_in_threadpool(
+                score_test_cases, run_id, run_request["test_description"],
+                run_request["test_dimensions_list"], run_request["selected_testcases"]
+            )
+    except evaluation_scheduler.QueueTimeout as e:
+        await run_in_threadpool(sys_db.update_evaluation_run, run_id, status=sys_db.RUN_FAILED, error=str(e))
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def evaluation_response(run_id, out_list, tokens, latency, latency_benchmark_ms=None):
+    # Union of keys in first-seen order: a case may lack metrics another case has
+    metric_keys = dict.fromkeys(k for d in out_list for k in d)
+    averages = {k: round(np.mean([d[k] for d in out_list if k in d]), 3) for k in metric_keys}
+
+    metrics_for_overall = ['Robustness', 'Biasness', 'Resilience', 'Accuracy']
+    
+    # No-evidence cases carry none of these; a run made only of them has no overall score
+    overall_metrics = [averages[m] for m in metrics_for_overall if m in averages]
+    overall_score = round(np.mean(overall_metrics), 3) if overall_metrics else None
+    
+    # Agent speed sits next to the quality scores; it doesn't enter overall_score
+    averages.update(latency)
+
+    return {
+        "run_id": run_id,
+        "scores": averages,
+        "overall_score": overall_score,
+        "latency_benchmark": {
+            "target_p95_ms": latency_benchmark_ms,
+            "p95_ms": latency["agent_latency_p95_ms"],
+            "passed": latency_passed(latency_benchmark_ms, latency["agent_latency_p95_ms"]),
+        },
+        "tokens": tokens
+    }
+
+
+@app.get("/evaluation/queue", tags=["Agent Evaluation"])
+async def get_evaluation_queue():
+    """
+    Queue depth and running evaluations per user / agent, plus LLM call concurrency
+    """
+    queue_stats = evaluation_scheduler.scheduler.stats()
+    if job_queue.EVAL_DISPATCH == "queue":
+        queue_stats["job_queue"] = await run_in_threadpool(job_queue.stats)
+    return queue_stats
+
+
+@app.get("/metrics", tags=["Agent Evaluation"])
+async def get_metrics():
+    """
+    LLM gateway counters: calls, retries, 429 / 5xx counts, backoff and throttled
+    time, and prompt / completion / embedding tokens since startup
+    """
+    return {
+        "llm_gateway": llm_gateway.stats(),
+        "shared_cache": await run_in_threadpool(shared_cache.stats),
+        "coalition_cache": coalition_cache.stats(),
+    }
 
 # Evaluation
 @app.post("/evaluation/", tags=["Agent Evaluation"])
@@ -412,6 +916,7 @@ async def run_evaluation( request: Request ):
     content_type = request.headers.get("Content-Type", "")
     
     print("content: ", content_type)
+    run_id = None
     try:
         
         if "multipart/form-data" in content_type:
@@ -439,7 +944,9 @@ async def run_evaluation( request: Request ):
             test_dimensions_list = ""
             step3 = workflow["step3"]
             for i in step3:
-                test_dimensions_list += i["dimension"] + ","
+                # Latency is measured on every run, not generated as test cases
+                if i["dimension"] != LATENCY_DIMENSION:
+                    test_dimensions_list += i["dimension"] + ","
             
             
         elif "application/json" in content_type:
@@ -462,80 +969,206 @@ async def run_evaluation( request: Request ):
             test_dimensions_list = ""
             step3 = workflow.get("step3")
             for i in step3:
-                test_dimensions_list += i.get("dimension") + ","
+                if i.get("dimension") != LATENCY_DIMENSION:
+                    test_dimensions_list += i.get("dimension") + ","
         
          
             
-        response = tgen.generate_testcases(test_description, test_dimensions_list, selected_testcases)
+        run_id = str(uuid.uuid4())
+        user, role = auth.request_identity(request)
+        # Quotas are per agent actually called: the bot calls go to AGENT_URL.
+        # step1's endpoint is the model provider URL, not a bot endpoint.
+        agent = AGENT_URL
+        run_request = {
+            "test_description": test_description,
+            "test_dimensions_list": test_dimensions_list,
+            "selected_testcases": selected_testcases,
+            "latency_benchmark_ms": latency_target(workflow.get("step3")),
+        }
         
-        # print("Response: ", response)
+        # Recorded up front so a run that fails part way can be resumed by run_id
+        await run_in_threadpool(sys_db.insert_evaluation_run, run_id, user, role, agent, run_request)
+        out_list, tokens, latency = await dispatch_evaluation(run_id, user, role, agent, run_request)
         
+        out_response = evaluation_response(run_id, out_list, tokens, latency, run_request["latency_benchmark_ms"])
         
-        try:
-            test_accuracy = response["Accuracy"] if response["Accuracy"] != None else ""
-        except Exception as e:
-            test_accuracy = ""
-            
         
-        try:
-            test_Biasness = response["Bias"] if response["Bias"] != None else ""
-        except Exception as e:
-            test_Biasness = ""
-            
-            
-        try:
-            test_Resilience = response["Resilience"] if response["Resilience"] != None else ""
-        except Exception as e:
-            test_Resilience = ""
-            
-            
-        try:
-            test_Robustness = response["Robustness"] if response["Robustness"] != None else ""
-        except Exception as e:
-            test_Robustness = ""
+        print("Score_response: ", out_list)
             
+        workflow.update(out_response)
         
-        test_cases = []
-        test_cases.append(test_accuracy.split(","))
-        test_cases.append(test_Biasness.split(","))
-        test_cases.append(test_Resilience.split(","))
-        test_cases.append(test_Robustness.split(","))
-        
-        out_list = []
-        
-        print("Test_Accuracy: ", test_accuracy)
-        
-        for test in test_cases:
-            print("TestCase_Prompt: ", test)
-            bot_response = get_client_bot_response(test)
-            print("bot_Response: ", bot_response)
-            score = evaluate.fetch_score(bot_response)
-            out_list.append(score)
-            
-        out_response = {}
+        return workflow
         
-        averages = {k: round(np.mean([d[k] for d in out_list]), 3) for k in out_list[0]}
+    except HTTPException as e:
+        raise with_run_id(e, run_id)
+    except Exception as e:
+        raise with_run_id(HTTPException(status_code=500, detail=f"Error fetching model: {str(e)}"), run_id)
 
-        metrics_for_overall = ['Robustness', 'Biasness', 'Resilience', 'Accuracy']
-        
-        overall_score = round(np.mean([averages[m] for m in metrics_for_overall]), 3)
 
-        out_response = {
-            "scores": averages,
-            "overall_score": overall_score
-        }
-        
-        
-        print("Score_response: ", out_list)
-            
-        workflow.update(out_response)
+def with_run_id(error, run_id):
+    """
+    Attach the run id to an evaluation error once the run has been recorded,
+    so the caller can poll /evaluation/{run_id}/status and resume it.
+    """
+    if run_id is None:
+        return error
+    detail = f"{error.detail} (run_id: {run_id})" if isinstance(error.detail, str) else error.detail
+    return HTTPException(status_code=error.status_code, detail=detail, headers={**(error.headers or {}), "X-Run-Id": run_id})
+    
+    
+@app.get("/evaluation/{run_id}/status", tags=["Agent Evaluation"])
+async def get_evaluation_status(run_id: str):
+    """
+    Status of an evaluation run and how many of its test cases are checkpointed
+    """
+    try:
+        run = await run_in_threadpool(sys_db.fetch_evaluation_run, run_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail="Evaluation run not found")
+        checkpoints = await run_in_threadpool(sys_db.fetch_checkpointed_cases, run_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching run: {str(e)}")
+    return {
+        "run_id": run_id,
+        "status": sys_db.run_status(run),
+        "error": run.error,
+        "cases": len(run.test_cases) if run.test_cases is not None else None,
+        "completed_cases": len(checkpoints),
+        "created_at": str(run.created_at),
+        "updated_at": str(run.updated_at),
+    }
+
+
+@app.post("/evaluation/{run_id}/resume", tags=["Agent Evaluation"])
+async def resume_evaluation(run_id: str, request: Request):
+    """
+    Finish a failed or interrupted run: reuses its test cases and checkpointed
+    cases, and scores only the cases that are missing. A run that is still
+    running (or already completed) is not resumed: 409.
+    """
+    try:
+        run = await run_in_threadpool(sys_db.fetch_evaluation_run, run_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail="Evaluation run not found")
+        # Atomic, so a double click can't score the remaining cases twice
+        if not await run_in_threadpool(sys_db.claim_evaluation_run, run_id):
+            raise HTTPException(status_code=409, detail=f"Evaluation run is {sys_db.run_status(run)}, not failed or interrupted")
         
-        return workflow
+        user, role = auth.request_identity(request)
+        out_list, tokens, latency = await dispatch_evaluation(run_id, user, role, run.agent, run.request)
         
+        return evaluation_response(run_id, out_list, tokens, latency, run.request.get("latency_benchmark_ms"))
+    
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching model: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error resuming evaluation: {str(e)}")
+
+
+@app.get("/evaluation/{run_id}/results", tags=["Agent Evaluation"])
+async def get_evaluation_results(run_id: str):
+    """
+    Per-test-case scores stored for an evaluation run
+    """
+    try:
+        rows = await async_db.fetch_evaluation_results(run_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching results: {str(e)}")
+    if not rows:
+        raise HTTPException(status_code=404, detail="Evaluation run not found")
+    results = [row_to_dict(row) for row in rows]
+    return {"run_id": run_id, "results": results, "count": len(results)}
+
+
+@app.post("/evaluation/rescore", tags=["Agent Evaluation"])
+async def rescore_evaluations(request: Request, run_id: Optional[str] = None, dry_run: bool = False):
+    """
+    Admin only. Recompute stored metrics from scoring artifacts with the current formulas (no agent / LLM calls)
+    """
+    require_admin(request)
+    try:
+        return await run_in_threadpool(rescore.rescore, run_id, dry_run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error re-scoring: {str(e)}")
+
+
+@app.get("/evaluation/{run_id}/results/export", tags=["Agent Evaluation"])
+async def export_evaluation_results(run_id: str, format: str = "parquet"):
+    """
+    Download a run's per-test-case results as Parquet, Arrow IPC or NumPy (.npz)
+    """
+    if format not in results_export.EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"invalid format '{format}'. allowed formats: {sorted(results_export.EXPORT_FORMATS)}"
+        )
+    serializer, media_type, extension = results_export.EXPORT_FORMATS[format]
+    
+    rows = await async_db.fetch_evaluation_results(run_id)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Evaluation run not found")
+    
+    try:
+        content = serializer(rows)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
     
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="evaluation_{run_id}.{extension}"'}
+    )
+
+
+@app.get("/analytics/trends", tags=["Analytics"])
+async def get_trends(
+    granularity: str = "day",
+    dimension: Optional[str] = None,
+    agent_name: Optional[str] = None,
+    agent_model: Optional[str] = None,
+    since: Optional[date] = None,
+    limit: int = Query(90, ge=1, le=1000)
+):
+    """
+    Score trends per agent, model and dimension from the pre-aggregated rollups.
+    Use dimension=Overall for the overall score.
+    """
+    if granularity not in sys_db.ROLLUP_GRANULARITIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"invalid granularity '{granularity}'. allowed: {list(sys_db.ROLLUP_GRANULARITIES)}"
+        )
+    try:
+        rows = await async_db.fetch_trends(
+            granularity=granularity,
+            dimension=dimension,
+            agent_name=agent_name,
+            agent_model=agent_model,
+            since=since,
+            limit=limit
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching trends: {str(e)}")
     
+    # Newest buckets are fetched first; charts want them oldest first
+    series = [
+        {
+            "bucket_start": str(row.bucket_start),
+            "agent_name": row.agent_name,
+            "agent_model": row.agent_model,
+            "dimension": row.dimension,
+            "count": row.sample_count,
+            "avg": round(row.score_avg, 3),
+            "min": row.score_min,
+            "max": row.score_max
+        }
+        for row in reversed(rows)
+    ]
+    return {"granularity": granularity, "series": series, "count": len(series)}
+
+
 @app.post("/save-analysis")
 async def store_analysis_score(request: Request):
     
@@ -561,6 +1194,9 @@ async def store_analysis_score(request: Request):
     
     step3 = workflow.get("step3")
     for i in step3:
+        # The latency target has its own columns: lower is better, in ms
+        if i.get("dimension") == LATENCY_DIMENSION:
+            continue
         test_dimensions_list += i.get("dimension") + ","
         print("TTPP: ",i)
         print("Yupe: ", type(i))
@@ -572,31 +1208,44 @@ async def store_analysis_score(request: Request):
     # [{dimension: "Accuracy", target: 90}, {dimension: "Robustness", target: 90}]
     
         
-    scenario_id = create_scenario(
-        name = step1.get("scenarioName"), 
-        description= step1.get("description"),
-        agent_name=step1.get("agentName"),
-        agent_model=step1.get("modelType"),
-        agent_endpoint=step1.get("endpoint"),
-        tags=step1.get("tags"),
-        benchmark=selected_test_dimensions_benchmark,
-        dimensions=selected_test_dimensions,
-        analysis_score=analysis_scores_selected_dimensions,
-        overall_score = workflow.get("overall_score")
-    )
+    scenario = {
+        "name": step1.get("scenarioName"),
+        "description": step1.get("description"),
+        "agent_name": step1.get("agentName"),
+        "agent_model": step1.get("modelType"),
+        "agent_endpoint": step1.get("endpoint"),
+        "tags": step1.get("tags"),
+        "benchmark": selected_test_dimensions_benchmark,
+        "dimensions": selected_test_dimensions,
+        "analysis_score": analysis_scores_selected_dimensions,
+        "overall_score": workflow.get("overall_score"),
+        "latency_benchmark_ms": latency_target(step3),
+        "latency_p95_ms": analysis_scores.get("agent_latency_p95_ms")
+    }
     
-    for test in step2:
+    test_suits = [
+        {
+            "name": test.get("name"),
+            "description": test.get("expectedCriteria"),
+            "jira_link": test.get("jiraLink"),
+            "test_dimensions": test.get("dimensions"),
+            "selected_test_cases": test.get("selectedTestCases"),
+            "type": test.get("type"),
+        }
+        for test in step2
+    ]
     
-        create_test_suit(
-            scenario_id=scenario_id.get("scenario_id"),
-            name=test.get("name"),
-            description=test.get("expectedCriteria"),
-            jira_link=test.get("jiraLink"),
-            test_dimensions=test.get("dimensions"),
-            selected_test_cases=test.get("selectedTestCases"),
-            type=test.get("type"),
-        )
+    # Scenario and suits are written atomically: a failure leaves no partial analysis behind
+    try:
+        scenario_id, test_suit_ids = await async_db.insert_scenario_with_test_suits(scenario, test_suits)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving analysis: {str(e)}")
     
+    return {
+        "message": "Analysis saved successfully",
+        "scenario_id": scenario_id,
+        "test_suit_ids": test_suit_ids
+    }
     
     
     
@@ -1,13 +1,28 @@
-from langchain.chat_models import init_chat_model
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
 
 load_dotenv()
 
-llm_model = init_chat_model(
-    model=os.getenv("LLM_MODEL"),
-    model_provider= os.getenv("MODEL_PROVIDER"),
-    api_version = os.getenv("MODEL_VERSION"),
-    azure_endpoint = os.getenv("MODEL_ENDPOINT"),
-    api_key = os.getenv("MODEL_KEY")
-)
\ No newline at end of file
+
+@lru_cache(maxsize=1)
+def get_llm():
+    # langchain is slow to import; defer it (and the client) to the first generation request
+    from langchain.chat_models import init_chat_model
+
+    return init_chat_model(
+        model=os.getenv("LLM_MODEL"),
+        model_provider= os.getenv("MODEL_PROVIDER"),
+        api_version = os.getenv("MODEL_VERSION"),
+        azure_endpoint = os.getenv("MODEL_ENDPOINT"),
+        api_key = os.getenv("MODEL_KEY"),
+        # Retries are handled by llm_gateway so backoff honours the shared limits
+        max_retries = 0,
+    )
+
+
+def __getattr__(name):
+    # `llm_config.llm_model` still resolves, built on first access
+    if name == "llm_model":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
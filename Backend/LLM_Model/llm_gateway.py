@@ -0,0 +1,354 @@
+import os
+import time
+import random
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from dotenv import load_dotenv
+
+from ..Scheduler.evaluation_scheduler import llm_slot
+
+load_dotenv()
+
+# Shared gateway for every chat / embedding call to Azure.
+#
+# Each deployment gets a sliding-window limiter on requests/min and
+# tokens/min (tokens estimated with tiktoken before the call, corrected with
+# the reported usage after it). Callers wait *before* sending when the
+# window is full instead of finding out through a 429. 429 and 5xx responses
+# are retried with jittered exponential backoff that honours Retry-After,
+# and each 429 also shrinks the usable budget for a while (AIMD), so a
+# misconfigured limit converges to what the deployment actually allows.
+
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", 300))
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", 150000))
+EMBEDDING_RPM_LIMIT = int(os.getenv("EMBEDDING_RPM_LIMIT", 1000))
+EMBEDDING_TPM_LIMIT = int(os.getenv("EMBEDDING_TPM_LIMIT", 350000))
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", 1.0))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", 60.0))
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", 256))
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+
+WINDOW_SECONDS = 60.0
+
+
+# Token estimation -------------------
+
+@lru_cache(maxsize=1)
+def get_encoder():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception:
+        # No tiktoken / encoding data offline: fall back to ~4 chars per token
+        return None
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoder = get_encoder()
+    if encoder is None:
+        return max(1, len(text) // 4)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, limit):
+    """
+    Returns (text cut to at most `limit` tokens, token count of the original).
+    """
+    if not text:
+        return text, 0
+    encoder = get_encoder()
+    if encoder is None:
+        tokens = max(1, len(text) // 4)
+        return (text if tokens <= limit else text[:limit * 4]), tokens
+    encoded = encoder.encode(text, disallowed_special=())
+    if len(encoded) <= limit:
+        return text, len(encoded)
+    return encoder.decode(encoded[:limit]), len(encoded)
+
+
+def message_text(message):
+    if isinstance(message, dict):
+        return str(message.get("content", ""))
+    return str(getattr(message, "content", message))
+
+
+def count_message_tokens(messages):
+    # ~4 tokens of chat framing per message on top of the content
+    return sum(count_tokens(message_text(m)) + 4 for m in messages)
+
+
+# Rate limiting -------------------
+
+class RateLimiter:
+
+    def __init__(self, name, rpm, tpm):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.scale = 1.0                 # AIMD factor applied to both limits
+        self._events = deque()           # (timestamp, requests, tokens)
+        self._requests = 0
+        self._tokens = 0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self.throttled_seconds = 0.0
+
+    def _expire(self, now):
+        while self._events and self._events[0][0] <= now - WINDOW_SECONDS:
+            _, requests, tokens = self._events.popleft()
+            self._requests -= requests
+            self._tokens -= tokens
+
+    def _wait_time(self, now, tokens):
+        if now < self._paused_until:
+            return self._paused_until - now
+        rpm = max(1, int(self.rpm * self.scale))
+        tpm = max(1, int(self.tpm * self.scale))
+        # A single call larger than the whole budget still goes through once the window is empty
+        fits_tokens = self._tokens + tokens <= tpm or self._tokens <= 0
+        if self._requests < rpm and fits_tokens:
+            return 0.0
+        if not self._events:
+            return 0.0
+        return max(0.01, self._events[0][0] + WINDOW_SECONDS - now)
+
+    def acquire(self, tokens):
+        waited = 0.0
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                delay = self._wait_time(now, tokens)
+                if delay <= 0:
+                    break
+                started = time.monotonic()
+                self._cond.wait(delay)
+                waited += time.monotonic() - started
+            self._events.append((now, 1, tokens))
+            self._requests += 1
+            self._tokens += tokens
+            self.throttled_seconds += waited
+        return waited
+
+    def correct_tokens(self, delta):
+        # Replace the estimate with the usage the API reported
+        if not delta:
+            return
+        with self._cond:
+            self._events.append((time.monotonic(), 0, delta))
+            self._tokens += delta
+            self._cond.notify_all()
+
+    def on_rate_limited(self, retry_after):
+        with self._cond:
+            self.scale = max(0.1, self.scale * 0.7)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def on_success(self):
+        with self._cond:
+            if self.scale < 1.0:
+                self.scale = min(1.0, self.scale + 0.02)
+
+    def stats(self):
+        with self._cond:
+            self._expire(time.monotonic())
+            return {
+                "rpm_limit": self.rpm,
+                "tpm_limit": self.tpm,
+                "effective_scale": round(self.scale, 3),
+                "requests_in_window": self._requests,
+                "tokens_in_window": self._tokens,
+                "throttled_seconds": round(self.throttled_seconds, 3),
+            }
+
+
+chat_limiter = RateLimiter("chat", LLM_RPM_LIMIT, LLM_TPM_LIMIT)
+embedding_limiter = RateLimiter("embedding", EMBEDDING_RPM_LIMIT, EMBEDDING_TPM_LIMIT)
+
+_stats_lock = threading.Lock()
+_stats = {
+    "calls": 0,
+    "retries": 0,
+    "rate_limited": 0,
+    "server_errors": 0,
+    "failures": 0,
+    "backoff_seconds": 0.0,
+}
+
+
+def _bump(key, amount=1):
+    with _stats_lock:
+        _stats[key] += amount
+
+
+# Token accounting -------------------
+
+TOKEN_KINDS = ("prompt_tokens", "completion_tokens", "embedding_tokens")
+
+_token_totals = Counter()
+# Accumulators opened by track_usage() in the current context, innermost last
+_usage_stack = ContextVar("llm_usage_stack", default=())
+
+
+def empty_usage():
+    return {kind: 0 for kind in TOKEN_KINDS}
+
+
+def add_usage(total, usage):
+    for kind in TOKEN_KINDS:
+        total[kind] = total.get(kind, 0) + usage.get(kind, 0)
+    return total
+
+
+def total_tokens(usage):
+    return sum(usage.get(kind, 0) for kind in TOKEN_KINDS)
+
+
+@contextmanager
+def track_usage():
+    """
+    Collect the tokens of every gateway call made inside the block (in this
+    thread / task) into the yielded dict. Blocks nest: outer ones see the
+    inner calls too.
+    """
+    usage = empty_usage()
+    token = _usage_stack.set(_usage_stack.get() + (usage,))
+    try:
+        yield usage
+    finally:
+        _usage_stack.reset(token)
+
+
+def _record_usage(usage):
+    with _stats_lock:
+        _token_totals.update(usage)
+    for accumulator in _usage_stack.get():
+        add_usage(accumulator, usage)
+
+
+# Retry handling -------------------
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _is_transient(error):
+    # Timeouts / dropped connections from httpx or the openai SDK carry no status
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+def _backoff(attempt, retry_after):
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+    if retry_after:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def call_with_limits(limiter, fn, estimated_tokens, usage_of):
+    """
+    Run fn() under the limiter and the global LLM slot, retrying 429 / 5xx /
+    transient errors. usage_of(result) returns the call's token usage by kind.
+    """
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        limiter.acquire(estimated_tokens)
+        _bump("calls")
+        try:
+            with llm_slot():
+                result = fn()
+        except Exception as e:
+            status = _status_code(e)
+            retry_after = _retry_after(e)
+            if status == 429:
+                _bump("rate_limited")
+                limiter.on_rate_limited(retry_after)
+            elif status is not None and status >= 500:
+                _bump("server_errors")
+            elif not _is_transient(e):
+                _bump("failures")
+                raise
+
+            if attempt == LLM_MAX_RETRIES:
+                _bump("failures")
+                raise
+            delay = _backoff(attempt, retry_after)
+            _bump("retries")
+            _bump("backoff_seconds", delay)
+            print(f"LLM {limiter.name} call failed ({status or type(e).__name__}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+
+        limiter.on_success()
+        usage = usage_of(result)
+        limiter.correct_tokens(total_tokens(usage) - estimated_tokens)
+        _record_usage(usage)
+        return result
+
+
+def _chat_usage(messages):
+    def usage_of(response):
+        # Azure reports usage on the message; estimate only if it is missing
+        reported = getattr(response, "usage_metadata", None) or {}
+        prompt = reported.get("input_tokens")
+        completion = reported.get("output_tokens")
+        if prompt is None:
+            prompt = count_message_tokens(messages)
+        if completion is None:
+            completion = count_tokens(message_text(response))
+        return {"prompt_tokens": prompt, "completion_tokens": completion}
+    return usage_of
+
+
+def _embedding_usage(tokens):
+    # LangChain's embedders drop the usage block, and the tiktoken count is exact for embeddings
+    return lambda _: {"embedding_tokens": tokens}
+
+
+# Public API -------------------
+
+def invoke_chat(llm, messages):
+    estimated = count_message_tokens(messages) + LLM_EXPECTED_COMPLETION_TOKENS
+    return call_with_limits(chat_limiter, lambda: llm.invoke(messages), estimated, _chat_usage(messages))
+
+
+def embed_query(embedder, text):
+    tokens = count_tokens(text)
+    return call_with_limits(embedding_limiter, lambda: embedder.embed_query(text), tokens, _embedding_usage(tokens))
+
+
+def embed_documents(embedder, texts):
+    tokens = sum(count_tokens(text) for text in texts)
+    return call_with_limits(embedding_limiter, lambda: embedder.embed_documents(texts), tokens, _embedding_usage(tokens))
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+        snapshot["tokens"] = add_usage(empty_usage(), _token_totals)
+    snapshot["backoff_seconds"] = round(snapshot["backoff_seconds"], 3)
+    snapshot["chat"] = chat_limiter.stats()
+    snapshot["embedding"] = embedding_limiter.stats()
+    return snapshot
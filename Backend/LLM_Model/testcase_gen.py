@@ -1,11 +1,15 @@
 from ..LLM_Model import llm_config as llm
+from . import llm_gateway
+from ..Model import shared_cache
 
-from langchain.chat_models import init_chat_model
-
+import os
 import json
 from typing import Dict, List, Optional
 import re
 
+# Generated suites are reused for identical requests for a while, across workers
+TESTCASE_CACHE_TTL_SECONDS = int(os.getenv("TESTCASE_CACHE_TTL_SECONDS", 3600))
+
 
 def generate_testcases(test_description: str, test_dimensions_list: str, selected_testcases: Optional[List[str]]) -> Dict:
     """
@@ -22,6 +26,11 @@ def generate_testcases(test_description: str, test_dimensions_list: str, selecte
     
     print("Entered")
     
+    cache_key = shared_cache.make_key(os.getenv("LLM_MODEL"), test_description, test_dimensions_list, (selected_testcases or [])[:5])
+    cached = shared_cache.get_json("testcases", cache_key)
+    if cached is not None:
+        return cached
+    
     dimensions = [dim.strip() for dim in test_dimensions_list.split(",") if dim.strip()]
     
     # Format selected testcases for the prompt - use CSV data as reference
@@ -90,7 +99,7 @@ FINAL OUTPUT FORMAT (JSON ONLY):
     
     try:
         # Call the LLM model
-        response = llm.llm_model.invoke(instruction)
+        response = llm_gateway.invoke_chat(llm.get_llm(), instruction)
         
         # Extract response content
         if hasattr(response, 'content'):
@@ -146,6 +155,8 @@ FINAL OUTPUT FORMAT (JSON ONLY):
             for key in keys_to_remove:
                 del result[key]
             
+            # Only well-formed generations are cached, never the fallbacks below
+            shared_cache.set_json("testcases", cache_key, result, ttl=TESTCASE_CACHE_TTL_SECONDS)
             return result
             
         except json.JSONDecodeError as e:
@@ -0,0 +1,232 @@
+import os
+import math
+import time
+import asyncio
+from collections import Counter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Load tests against an agent endpoint.
+#
+# closed: `concurrency` virtual users, each sending its next request as soon
+#   as the previous one returns (throughput is whatever the agent sustains).
+# open: requests arrive at a fixed `arrival_rate` per second whether or not
+#   earlier ones have returned, at most `concurrency` in flight; arrivals
+#   that find no free slot are counted as dropped. Latency is measured from
+#   the scheduled arrival time, so a stalled agent can't hide its queueing
+#   delay (coordinated omission).
+# Both ramp up linearly over `ramp_up_seconds` (users started one by one, or
+# the arrival rate rising from zero). Requests cycle through the test cases.
+
+LOAD_TEST_MAX_CONCURRENCY = int(os.getenv("LOAD_TEST_MAX_CONCURRENCY", 200))
+LOAD_TEST_MAX_DURATION_SECONDS = int(os.getenv("LOAD_TEST_MAX_DURATION_SECONDS", 600))
+LOAD_TEST_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LOAD_TEST_REQUEST_TIMEOUT_SECONDS", 30))
+# Relative precision of the latency histogram buckets
+LATENCY_HISTOGRAM_PRECISION = float(os.getenv("LATENCY_HISTOGRAM_PRECISION", 0.01))
+
+LOAD_TEST_MODES = ("closed", "open")
+LATENCY_PERCENTILES = (50, 90, 95, 99, 99.9)
+
+
+class LoadTestError(ValueError):
+    pass
+
+
+# Latency histogram -------------------
+
+class LatencyHistogram:
+    """
+    HDR-style histogram: log-scaled buckets, each `precision` wider than the
+    previous one, so every percentile is exact to within that relative error
+    at any scale, and memory grows with the latency range, not the sample count.
+    """
+
+    def __init__(self, precision=LATENCY_HISTOGRAM_PRECISION):
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, value_ms):
+        value_ms = max(value_ms, 0.001)
+        self.buckets[math.ceil(math.log(value_ms) / self._log_base)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.min = min(self.min, value_ms)
+        self.max = max(self.max, value_ms)
+
+    def bucket_upper(self, bucket):
+        return math.exp(bucket * self._log_base)
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # Clamp to what was really observed at the extremes
+                return min(max(self.bucket_upper(bucket), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        summary = {
+            "count": self.count,
+            "min_ms": round(self.min, 3) if self.count else None,
+            "mean_ms": round(self.total / self.count, 3) if self.count else None,
+            "max_ms": round(self.max, 3) if self.count else None,
+        }
+        for percent in LATENCY_PERCENTILES:
+            value = self.percentile(percent)
+            summary[f"p{percent:g}_ms".replace(".", "_")] = round(value, 3) if value is not None else None
+        return summary
+
+    def to_dict(self):
+        # [bucket upper bound in ms, count], enough to rebuild any percentile later
+        return {
+            "precision": self.precision,
+            "buckets": [[round(self.bucket_upper(b), 3), self.buckets[b]] for b in sorted(self.buckets)],
+        }
+
+
+# Runner -------------------
+
+class LoadTestRun:
+
+    def __init__(self, endpoint, test_cases, timeout_seconds):
+        self.endpoint = endpoint
+        self.test_cases = test_cases
+        self.timeout_seconds = timeout_seconds
+        self.latency = LatencyHistogram()
+        self.errors = Counter()
+        self.sent = 0
+        self.succeeded = 0
+        self.dropped = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def next_test_case(self):
+        test_case = self.test_cases[self.sent % len(self.test_cases)]
+        self.sent += 1
+        return test_case
+
+    async def send(self, client, scheduled_at=None):
+        """
+        One request, timed from scheduled_at (open loop) or from now.
+        """
+        test_case = self.next_test_case()
+        started = scheduled_at if scheduled_at is not None else time.perf_counter()
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # Same contract as the evaluation path: ?input=<test case> -> {"message": ...}
+            response = await client.post(self.endpoint, params={"input": test_case}, timeout=self.timeout_seconds)
+            if response.status_code >= 400:
+                self.errors[f"http_{response.status_code}"] += 1
+            elif "message" not in response.json():
+                self.errors["invalid_response"] += 1
+            else:
+                self.succeeded += 1
+                self.latency.record((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            self.errors[type(e).__name__] += 1
+        finally:
+            self.in_flight -= 1
+
+    def report(self, elapsed):
+        failed = sum(self.errors.values())
+        completed = self.succeeded + failed
+        return {
+            "requests": completed,
+            "succeeded": self.succeeded,
+            "failed": failed,
+            "dropped": self.dropped,
+            "error_rate": round((failed + self.dropped) / (completed + self.dropped), 4) if completed + self.dropped else 0.0,
+            "errors": dict(self.errors),
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_rps": round(self.succeeded / elapsed, 3) if elapsed > 0 else 0.0,
+            "max_in_flight": self.max_in_flight,
+            "latency": self.latency.summary(),
+            "latency_histogram": self.latency.to_dict(),
+        }
+
+
+async def _closed_loop(run, client, concurrency, duration_seconds, ramp_up_seconds, max_requests):
+    started = time.perf_counter()
+    deadline = started + duration_seconds
+
+    async def virtual_user(index):
+        await asyncio.sleep(ramp_up_seconds * index / concurrency)
+        while time.perf_counter() < deadline and (max_requests is None or run.sent < max_requests):
+            await run.send(client)
+
+    await asyncio.gather(*(virtual_user(index) for index in range(concurrency)))
+
+
+async def _open_loop(run, client, concurrency, duration_seconds, ramp_up_seconds, arrival_rate, max_requests):
+    started = time.perf_counter()
+    pending = set()
+    arrivals = 0
+    while max_requests is None or arrivals < max_requests:
+        # Arrival n is due when the (ramping) rate has integrated to n
+        if ramp_up_seconds > 0 and arrivals < arrival_rate * ramp_up_seconds / 2:
+            offset = math.sqrt(2 * arrivals * ramp_up_seconds / arrival_rate)
+        else:
+            offset = arrivals / arrival_rate + ramp_up_seconds / 2
+        if offset >= duration_seconds:
+            break
+        scheduled_at = started + offset
+        delay = scheduled_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        arrivals += 1
+        if run.in_flight >= concurrency:
+            run.dropped += 1
+            continue
+        task = asyncio.create_task(run.send(client, scheduled_at))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending)
+
+
+def validate(mode, concurrency, duration_seconds, ramp_up_seconds, arrival_rate):
+    if mode not in LOAD_TEST_MODES:
+        raise LoadTestError(f"invalid mode '{mode}'. allowed modes: {list(LOAD_TEST_MODES)}")
+    if not 1 <= concurrency <= LOAD_TEST_MAX_CONCURRENCY:
+        raise LoadTestError(f"concurrency must be between 1 and {LOAD_TEST_MAX_CONCURRENCY}")
+    if not 0 < duration_seconds <= LOAD_TEST_MAX_DURATION_SECONDS:
+        raise LoadTestError(f"duration_seconds must be between 0 and {LOAD_TEST_MAX_DURATION_SECONDS}")
+    if not 0 <= ramp_up_seconds < duration_seconds:
+        raise LoadTestError("ramp_up_seconds must be shorter than duration_seconds")
+    if mode == "open" and not (arrival_rate and arrival_rate > 0):
+        raise LoadTestError("open-loop mode needs arrival_rate > 0")
+
+
+async def run_load_test(endpoint, test_cases, mode="closed", concurrency=10, duration_seconds=60,
+                        ramp_up_seconds=0, arrival_rate=None, max_requests=None,
+                        timeout_seconds=LOAD_TEST_REQUEST_TIMEOUT_SECONDS):
+    """
+    Drive `endpoint` with `test_cases` and return latency / error / throughput figures.
+    """
+    validate(mode, concurrency, duration_seconds, ramp_up_seconds, arrival_rate)
+    if not test_cases:
+        raise LoadTestError("no test cases to send")
+
+    # httpx ships with the openai SDK; imported here so the API starts without it
+    import httpx
+
+    run = LoadTestRun(endpoint, test_cases, timeout_seconds)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(limits=limits) as client:
+        if mode == "closed":
+            await _closed_loop(run, client, concurrency, duration_seconds, ramp_up_seconds, max_requests)
+        else:
+            await _open_loop(run, client, concurrency, duration_seconds, ramp_up_seconds, arrival_rate, max_requests)
+    return run.report(time.perf_counter() - started)
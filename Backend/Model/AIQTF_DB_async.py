@@ -0,0 +1,272 @@
+import threading
+import sqlalchemy as sql
+from contextlib import asynccontextmanager
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from .AIQTF_DB import (
+    ASYNC_DB_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    metadata,
+    scenario_table,
+    test_suit_table,
+    agent_list_table,
+    scenarios_page_query,
+    test_suits_page_query,
+    agents_page_query,
+    split_page,
+    test_suit_rows,
+    test_suit_bulk_insert,
+    evaluation_result_table,
+    scoring_artifact_table,
+    batched,
+    rollup_rows,
+    rollup_upsert_query,
+    trends_query,
+)
+
+# Async mirror of AIQTF_DB: asyncpg against Postgres, aiosqlite for DB_PROFILE=local.
+# Shares the table definitions so both paths always read/write the same schema.
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    # Created on first query, so asyncpg / aiosqlite are only imported when needed
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_async_engine(
+                    ASYNC_DB_URL,
+                    pool_size=DB_POOL_SIZE,
+                    max_overflow=DB_MAX_OVERFLOW,
+                    pool_timeout=DB_POOL_TIMEOUT,
+                    pool_recycle=DB_POOL_RECYCLE,
+                    pool_pre_ping=True,
+                )
+    return _engine
+
+
+def __getattr__(name):
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def init_db():
+    async with get_engine().begin() as conn:
+        await conn.run_sync(metadata.create_all)
+
+
+async def dispose():
+    # Nothing to close if no request ever touched the database
+    if _engine is not None:
+        await _engine.dispose()
+
+
+@asynccontextmanager
+async def transaction():
+    """
+    Async counterpart of AIQTF_DB.transaction(): one pooled connection and
+    one transaction per unit of work.
+    """
+    async with get_engine().begin() as conn:
+        yield conn
+
+
+# Scenarios -------------------
+
+async def insert_scenario(name, description, agent_name, agent_endpoint, agent_model, tags=None, benchmark=None, dimensions=None, analysis_score=None, overall_score=None, latency_benchmark_ms=None, latency_p95_ms=None):
+    insert_query = scenario_table.insert().values(
+        name=name,
+        description=description,
+        agent_name=agent_name,
+        agent_endpoint=agent_endpoint,
+        agent_model=agent_model,
+        tags=tags,
+        benchmark=benchmark,
+        dimensions=dimensions,
+        analysis_score=analysis_score,
+        overall_score=overall_score,
+        latency_benchmark_ms=latency_benchmark_ms,
+        latency_p95_ms=latency_p95_ms
+    ).returning(scenario_table.c.id)
+    async with transaction() as conn:
+        res = await conn.execute(insert_query)
+        return res.scalar()
+
+
+async def fetch_all_scenarios():
+    select_query = sql.select(scenario_table)
+    async with transaction() as conn:
+        result = await conn.execute(select_query)
+        return result.fetchall()
+
+
+async def fetch_scenario_by_id(scenario_id, scenario_name=None):
+    conditions = [scenario_table.c.id == scenario_id]
+    if scenario_name:
+        conditions.append(scenario_table.c.name == scenario_name)
+    select_query = sql.select(scenario_table).where(sql.and_(*conditions))
+    async with transaction() as conn:
+        result = await conn.execute(select_query)
+        return result.fetchone()
+
+
+async def fetch_scenario_by_name(scenario_name):
+    select_query = sql.select(scenario_table).where(scenario_table.c.name == scenario_name)
+    async with transaction() as conn:
+        result = await conn.execute(select_query)
+        return result.fetchone()
+
+
+# Test Suits -------------------
+
+async def insert_test_suit(scenario_id, name, description, jira_link=None, test_dimensions=None, selected_test_cases=None, type="Automated"):
+    insert_query = test_suit_table.insert().values(
+        scenario_id=scenario_id,
+        name=name,
+        description=description,
+        jira_link=jira_link,
+        test_dimensions=test_dimensions,
+        selected_test_cases=selected_test_cases,
+        type=type
+    ).returning(test_suit_table.c.id)
+    async with transaction() as conn:
+        res = await conn.execute(insert_query)
+        return res.scalar()
+
+
+async def fetch_test_suits_by_scenario(scenario_id):
+    select_query = sql.select(test_suit_table).where(test_suit_table.c.scenario_id == scenario_id)
+    async with transaction() as conn:
+        result = await conn.execute(select_query)
+        return result.fetchall()
+
+
+async def fetch_test_suit_by_id(test_suit_id):
+    select_query = sql.select(test_suit_table).where(test_suit_table.c.id == test_suit_id)
+    async with transaction() as conn:
+        result = await conn.execute(select_query)
+        return result.fetchone()
+
+
+async def delete_test_suit(id):
+    delete_query = test_suit_table.delete().where(test_suit_table.c.id == id)
+    async with transaction() as conn:
+        await conn.execute(delete_query)
+
+
+async def fetch_all_test_suits():
+    select_query = sql.select(test_suit_table)
+    async with transaction() as conn:
+        result = await conn.execute(select_query)
+        return result.fetchall()
+
+
+async def insert_scenario_with_test_suits(scenario, test_suits):
+    """
+    Scenario plus all of its test suits in one transaction, see
+    AIQTF_DB.insert_scenario_with_test_suits.
+    """
+    async with transaction() as conn:
+        scenario_id = (await conn.execute(
+            scenario_table.insert().values(**scenario).returning(scenario_table.c.id)
+        )).scalar()
+        test_suit_ids = []
+        if test_suits:
+            res = await conn.execute(test_suit_bulk_insert, test_suit_rows(scenario_id, test_suits))
+            test_suit_ids = list(res.scalars())
+        # Trend rollups move in the same transaction as the scenario they count
+        rollups = rollup_rows(scenario)
+        if rollups:
+            await conn.execute(rollup_upsert_query(conn.dialect.name), rollups)
+    return scenario_id, test_suit_ids
+
+
+# Agents -------------------
+
+async def insert_agent(model_provider, model_name, api_version, api_endpoint, api_key, description):
+    insert_query = agent_list_table.insert().values(
+        model_provider=model_provider,
+        model_name=model_name,
+        api_version=api_version,
+        api_endpoint=api_endpoint,
+        api_key=api_key,
+        description=description
+    ).returning(agent_list_table.c.id)
+    async with transaction() as conn:
+        res = await conn.execute(insert_query)
+        return res.scalar()
+
+
+async def fetch_agent_by_id(id):
+    select_query = sql.select(agent_list_table).where(agent_list_table.c.id == id)
+    async with transaction() as conn:
+        result = await conn.execute(select_query)
+        return result.fetchone()
+
+
+async def fetch_all_agents():
+    select_query = sql.select(agent_list_table)
+    async with transaction() as conn:
+        result = await conn.execute(select_query)
+        return result.fetchall()
+
+
+async def delete_selected_agent(id):
+    delete_query = agent_list_table.delete().where(agent_list_table.c.id == id)
+    async with transaction() as conn:
+        await conn.execute(delete_query)
+
+
+# Keyset pagination -------------------
+
+async def fetch_scenarios_page(limit, cursor=None, fields=None, **filters):
+    query = scenarios_page_query(limit, cursor, fields, dialect_name=get_engine().dialect.name, **filters)
+    async with transaction() as conn:
+        rows = (await conn.execute(query)).fetchall()
+    return split_page(rows, limit, ["created_at", "id"])
+
+
+async def fetch_test_suits_page(limit, cursor=None, fields=None, **filters):
+    query = test_suits_page_query(limit, cursor, fields, **filters)
+    async with transaction() as conn:
+        rows = (await conn.execute(query)).fetchall()
+    return split_page(rows, limit, ["id"])
+
+
+async def fetch_agents_page(limit, cursor=None, fields=None):
+    query = agents_page_query(limit, cursor, fields)
+    async with transaction() as conn:
+        rows = (await conn.execute(query)).fetchall()
+    return split_page(rows, limit, ["id"])
+
+
+# Evaluation results -------------------
+
+async def insert_evaluation_results(rows, artifacts=()):
+    async with transaction() as conn:
+        for batch in batched(rows):
+            await conn.execute(evaluation_result_table.insert(), batch)
+        for batch in batched(list(artifacts)):
+            await conn.execute(scoring_artifact_table.insert(), batch)
+
+
+async def fetch_evaluation_results(run_id):
+    select_query = sql.select(evaluation_result_table).where(
+        evaluation_result_table.c.run_id == run_id
+    ).order_by(evaluation_result_table.c.case_index)
+    async with transaction() as conn:
+        return (await conn.execute(select_query)).fetchall()
+
+
+# Scenario rollups -------------------
+
+async def fetch_trends(**filters):
+    async with transaction() as conn:
+        return (await conn.execute(trends_query(**filters))).fetchall()
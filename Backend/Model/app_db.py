@@ -0,0 +1,58 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Connection manager for the SQLite user / session store.
+# Each thread keeps one open connection per database file instead of
+# connecting per query; WAL lets readers proceed while a login writes.
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", 256))
+
+_local = threading.local()
+
+
+def _connect(path):
+    # sqlite3 keeps compiled statements per connection keyed by SQL text,
+    # so reusing the connection reuses the prepared statements too
+    conn = sqlite3.connect(
+        path,
+        timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+        cached_statements=SQLITE_STATEMENT_CACHE,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def get_connection(path):
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = connections[path] = _connect(path)
+    return conn
+
+
+@contextmanager
+def transaction(path):
+    """
+    Yield this thread's connection; commit on success, roll back on error.
+    The connection stays open for the next call.
+    """
+    conn = get_connection(path)
+    with conn:
+        yield conn
+
+
+def close_thread_connections():
+    connections = getattr(_local, "connections", None) or {}
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
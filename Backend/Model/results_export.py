@@ -0,0 +1,95 @@
+import io
+import numpy as np
+
+from .AIQTF_DB import evaluation_result_table
+
+# Columnar exports of evaluation_results rows for dashboards / trend analysis.
+# NumPy export needs nothing extra; Parquet and Arrow need pyarrow installed.
+
+
+def _column_kind(column):
+    python_type = column.type.python_type
+    if python_type in (int, float):
+        return "number"
+    if python_type.__name__ == "datetime":
+        return "datetime"
+    return "string"
+
+
+def to_numpy(rows):
+    """
+    One array per column: float64 for metrics, latency and token counts
+    (NULL -> NaN), datetime64[us] for timestamps, unicode strings otherwise.
+    """
+    arrays = {}
+    for column in evaluation_result_table.columns:
+        values = [row._mapping[column.name] for row in rows]
+        kind = _column_kind(column)
+        if kind == "number":
+            arrays[column.name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        elif kind == "datetime":
+            arrays[column.name] = np.array(values, dtype="datetime64[us]")
+        else:
+            arrays[column.name] = np.array(["" if v is None else v for v in values], dtype=np.str_)
+    return arrays
+
+
+def to_npz_bytes(rows):
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **to_numpy(rows))
+    return buffer.getvalue()
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("pyarrow is required for parquet/arrow export (pip install pyarrow)")
+    return pyarrow
+
+
+def _arrow_type(pa, column):
+    python_type = column.type.python_type
+    if python_type is int:
+        return pa.int64()
+    if python_type is float:
+        return pa.float64()
+    if _column_kind(column) == "datetime":
+        return pa.timestamp("us")
+    return pa.string()
+
+
+def to_arrow_table(rows):
+    pa = _pyarrow()
+    # Explicit schema so all-NULL columns (e.g. token counts) keep their type
+    schema = pa.schema([(column.name, _arrow_type(pa, column)) for column in evaluation_result_table.columns])
+    return pa.table({
+        column.name: [row._mapping[column.name] for row in rows]
+        for column in evaluation_result_table.columns
+    }, schema=schema)
+
+
+def to_parquet_bytes(rows):
+    _pyarrow()
+    import pyarrow.parquet as pq
+
+    buffer = io.BytesIO()
+    pq.write_table(to_arrow_table(rows), buffer)
+    return buffer.getvalue()
+
+
+def to_arrow_ipc_bytes(rows):
+    pa = _pyarrow()
+    table = to_arrow_table(rows)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# format -> (serializer, media type, file extension)
+EXPORT_FORMATS = {
+    "parquet": (to_parquet_bytes, "application/vnd.apache.parquet", "parquet"),
+    "arrow": (to_arrow_ipc_bytes, "application/vnd.apache.arrow.file", "arrow"),
+    "npz": (to_npz_bytes, "application/octet-stream", "npz"),
+}
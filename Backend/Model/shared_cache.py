@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+from . import app_db
+
+load_dotenv()
+
+# Scoring cache shared by every worker process on the host.
+#
+# One SQLite file in WAL mode: each thread of each uvicorn worker keeps its
+# own connection (app_db), readers never block and writers only wait on each
+# other for the few microseconds of an upsert. Entries are namespaced
+# ("embedding", "regeneration", "testcases") and keyed by a hash of
+# everything the cached value depends on, model name included.
+
+SHARED_STATE_DIR = os.getenv(
+    "SHARED_STATE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Database", "appDB")
+)
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", os.path.join(SHARED_STATE_DIR, "shared_cache.db"))
+SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", "1") == "1"
+SHARED_CACHE_TTL_SECONDS = int(os.getenv("SHARED_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+SHARED_CACHE_PURGE_EVERY = int(os.getenv("SHARED_CACHE_PURGE_EVERY", 1000))
+
+SELECT_ENTRY_SQL = "SELECT value FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?"
+UPSERT_ENTRY_SQL = """
+    INSERT INTO cache_entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+"""
+DELETE_EXPIRED_SQL = "DELETE FROM cache_entries WHERE expires_at <= ?"
+COUNT_ENTRIES_SQL = "SELECT namespace, COUNT(*) FROM cache_entries GROUP BY namespace"
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "writes": 0, "errors": 0}
+
+
+def create_cache_table():
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(SHARED_CACHE_PATH)), exist_ok=True)
+        with app_db.transaction(SHARED_CACHE_PATH) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_expires_at ON cache_entries (expires_at)")
+        _schema_ready = True
+
+
+def make_key(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        text = part if isinstance(part, str) else json.dumps(part, sort_keys=True, default=str)
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+def _bump(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def _get(namespace, key):
+    if not SHARED_CACHE_ENABLED:
+        return None
+    try:
+        create_cache_table()
+        with app_db.transaction(SHARED_CACHE_PATH) as conn:
+            row = conn.execute(SELECT_ENTRY_SQL, (namespace, key, time.time())).fetchone()
+    except Exception as e:
+        # The cache is an optimisation: a locked or broken file must not fail scoring
+        _bump("errors")
+        print("Shared cache read failed: ", e)
+        return None
+    _bump("hits" if row else "misses")
+    return row[0] if row else None
+
+
+def _set(namespace, key, value, ttl):
+    if not SHARED_CACHE_ENABLED:
+        return
+    now = time.time()
+    try:
+        create_cache_table()
+        with app_db.transaction(SHARED_CACHE_PATH) as conn:
+            conn.execute(UPSERT_ENTRY_SQL, (namespace, key, value, now + (ttl or SHARED_CACHE_TTL_SECONDS)))
+            with _stats_lock:
+                _stats["writes"] += 1
+                purge = _stats["writes"] % SHARED_CACHE_PURGE_EVERY == 0
+            if purge:
+                conn.execute(DELETE_EXPIRED_SQL, (now,))
+    except Exception as e:
+        _bump("errors")
+        print("Shared cache write failed: ", e)
+
+
+def get_json(namespace, key):
+    value = _get(namespace, key)
+    return json.loads(value) if value is not None else None
+
+
+def set_json(namespace, key, value, ttl=None):
+    _set(namespace, key, json.dumps(value).encode("utf-8"), ttl)
+
+
+# Vectors are stored as raw float64, exactly what the embedding client
+# returned, so a cache hit scores the same as a miss. The namespace suffix
+# keeps entries from the earlier float32 format from being misread.
+VECTOR_DTYPE = np.float64
+
+
+def _vector_namespace(namespace):
+    return f"{namespace}.f64"
+
+
+def get_vector(namespace, key):
+    value = _get(_vector_namespace(namespace), key)
+    return np.frombuffer(value, dtype=VECTOR_DTYPE).tolist() if value is not None else None
+
+
+def set_vector(namespace, key, vector, ttl=None):
+    _set(_vector_namespace(namespace), key, np.asarray(vector, dtype=VECTOR_DTYPE).tobytes(), ttl)
+
+
+def stats():
+    with _stats_lock:
+        snapshot = dict(_stats)
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_ratio"] = round(snapshot["hits"] / lookups, 4) if lookups else 0.0
+    snapshot["enabled"] = SHARED_CACHE_ENABLED
+    snapshot["path"] = SHARED_CACHE_PATH
+    if SHARED_CACHE_ENABLED:
+        try:
+            create_cache_table()
+            with app_db.transaction(SHARED_CACHE_PATH) as conn:
+                snapshot["entries"] = dict(conn.execute(COUNT_ENTRIES_SQL).fetchall())
+        except Exception as e:
+            snapshot["entries_error"] = str(e)
+    return snapshot
@@ -3,10 +3,16 @@ from dotenv import load_dotenv
 import sqlite3
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from . import app_db
+
 load_dotenv()
 
 APP_DB_PATH = os.getenv("APP_DB_PATH") +"/users.db"
 
+INSERT_USER_SQL = "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)"
+SELECT_USERS_SQL = "SELECT username, role FROM users WhERE role is not 'procurement_manager'"
+SELECT_USER_BY_NAME_SQL = "SELECT username, password_hash, role FROM users WHERE username = ?"
+
 # ----------------- User Constructor -------------
 class User:
     def __init__(self, username, password_hash, role = "user"):
@@ -18,19 +24,15 @@ class User:
 
     @classmethod
     def create_table(cls):
-        conn = sqlite3.connect(APP_DB_PATH)
-        cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                role TEXT NOT NULL DEFAULT 'user'
-            )
-        """)
-
-        conn.commit()
-        conn.close()
+        with app_db.transaction(APP_DB_PATH) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE NOT NULL,
+                    password_hash TEXT NOT NULL,
+                    role TEXT NOT NULL DEFAULT 'user'
+                )
+            """)
         
 #  User Model Methods -------------------
 
@@ -40,28 +42,24 @@ class User:
         Create a user with specified role (defaults to 'user').
         Raises sqlite3.IntegrityError if username exists.
         """
-        print("PasswordL :", raw_password)
         password_hash = generate_password_hash(raw_password)
-        conn = sqlite3.connect(APP_DB_PATH)
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
-            (username, password_hash, role)
-        )
-        conn.commit()
-        conn.close()
-        return User(username=username, password_hash=password_hash, role=role)  
+        return cls.insert(username, password_hash, role=role)
+
+    @classmethod
+    def insert(cls, username, password_hash, role="user"):
+        """
+        Store a user whose password was already hashed (see Auth.password_pool).
+        Raises sqlite3.IntegrityError if username exists.
+        """
+        with app_db.transaction(APP_DB_PATH) as conn:
+            conn.execute(INSERT_USER_SQL, (username, password_hash, role))
+        return User(username=username, password_hash=password_hash, role=role)
 
     @classmethod  # Fetch users
     def fetch_users(cls):
 
-        conn = sqlite3.connect(APP_DB_PATH)
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT username, role FROM users WhERE role is not 'procurement_manager'"
-        )
-        rows = cur.fetchall()
-        conn.close()
+        with app_db.transaction(APP_DB_PATH) as conn:
+            rows = conn.execute(SELECT_USERS_SQL).fetchall()
 
         users_data = []
         for row in rows:
@@ -73,11 +71,8 @@ class User:
     def find_by_username(cls, username):
 
         
-        conn = sqlite3.connect(APP_DB_PATH)
-        cur = conn.cursor()
-        cur.execute("SELECT username, password_hash, role FROM users WHERE username = ?", (username,))
-        row = cur.fetchone()
-        conn.close()
+        with app_db.transaction(APP_DB_PATH) as conn:
+            row = conn.execute(SELECT_USER_BY_NAME_SQL, (username,)).fetchone()
         if row:
             return User(username=row[0], password_hash=row[1], role=row[2])
         return None
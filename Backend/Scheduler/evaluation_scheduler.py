@@ -0,0 +1,200 @@
+import os
+import time
+import asyncio
+import threading
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Admission control for /evaluation/ runs and the LLM calls they make.
+#
+# Runs wait in one FIFO queue per user; whenever a slot frees up the queues
+# are served round-robin, so a user with a huge backlog cannot starve the
+# others. A run starts only when it fits under all three limits: global,
+# per user (higher for admins) and per target agent endpoint.
+
+EVAL_GLOBAL_CONCURRENCY = int(os.getenv("EVAL_GLOBAL_CONCURRENCY", 4))
+EVAL_USER_CONCURRENCY = int(os.getenv("EVAL_USER_CONCURRENCY", 1))
+EVAL_ADMIN_USER_CONCURRENCY = int(os.getenv("EVAL_ADMIN_USER_CONCURRENCY", 2))
+EVAL_AGENT_CONCURRENCY = int(os.getenv("EVAL_AGENT_CONCURRENCY", 2))
+EVAL_QUEUE_TIMEOUT_SECONDS = float(os.getenv("EVAL_QUEUE_TIMEOUT_SECONDS", 600))
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+
+
+class QueueTimeout(Exception):
+    pass
+
+
+class _Ticket:
+    __slots__ = ("user", "role", "agent", "future", "enqueued_at")
+
+    def __init__(self, user, role, agent, future):
+        self.user = user
+        self.role = role
+        self.agent = agent
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class EvaluationScheduler:
+
+    def __init__(self, global_limit, user_limit, admin_user_limit, agent_limit):
+        self.global_limit = global_limit
+        self.user_limit = user_limit
+        self.admin_user_limit = admin_user_limit
+        self.agent_limit = agent_limit
+
+        self._queues = OrderedDict()       # user -> deque of waiting tickets
+        self._turns = deque()              # users with waiting tickets, round-robin order
+        self._running = 0
+        self._running_by_user = Counter()
+        self._running_by_agent = Counter()
+        self._started = 0
+        self._wait_seconds = 0.0
+
+    def _user_limit(self, role):
+        return self.admin_user_limit if role == "admin" else self.user_limit
+
+    def _next_eligible(self, user):
+        queue = self._queues[user]
+        if not queue or self._running_by_user[user] >= self._user_limit(queue[0].role):
+            return None
+        # Skip runs whose agent is saturated so they don't block this user's other runs
+        for ticket in queue:
+            if self._running_by_agent[ticket.agent] < self.agent_limit:
+                return ticket
+        return None
+
+    def _grant(self, ticket):
+        queue = self._queues[ticket.user]
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[ticket.user]
+            self._turns.remove(ticket.user)
+        self._running += 1
+        self._running_by_user[ticket.user] += 1
+        self._running_by_agent[ticket.agent] += 1
+        self._started += 1
+        self._wait_seconds += time.monotonic() - ticket.enqueued_at
+        ticket.future.set_result(None)
+
+    def _dispatch(self):
+        granted = True
+        while granted and self._running < self.global_limit:
+            granted = False
+            for _ in range(len(self._turns)):
+                user = self._turns[0]
+                self._turns.rotate(-1)      # whoever is served goes to the back
+                ticket = self._next_eligible(user)
+                if ticket is not None:
+                    self._grant(ticket)
+                    granted = True
+                    break
+
+    def _release(self, ticket):
+        self._running -= 1
+        self._running_by_user[ticket.user] -= 1
+        self._running_by_agent[ticket.agent] -= 1
+        if self._running_by_user[ticket.user] <= 0:
+            del self._running_by_user[ticket.user]
+        if self._running_by_agent[ticket.agent] <= 0:
+            del self._running_by_agent[ticket.agent]
+        self._dispatch()
+
+    def _abandon(self, ticket):
+        queue = self._queues.get(ticket.user)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.user]
+                self._turns.remove(ticket.user)
+
+    @asynccontextmanager
+    async def slot(self, user, role, agent, timeout=EVAL_QUEUE_TIMEOUT_SECONDS):
+        """
+        Wait for this user's turn and free capacity on the agent, then hold
+        a run slot for the duration of the block.
+        """
+        ticket = _Ticket(user, role, agent, asyncio.get_running_loop().create_future())
+        if user not in self._queues:
+            self._queues[user] = deque()
+            self._turns.append(user)
+        self._queues[user].append(ticket)
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if ticket.future.done():
+                # Granted just as we gave up: hand the slot straight back
+                self._release(ticket)
+            else:
+                self._abandon(ticket)
+                ticket.future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                raise QueueTimeout(f"evaluation queue wait exceeded {timeout}s")
+            raise
+
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def stats(self):
+        return {
+            "limits": {
+                "global": self.global_limit,
+                "per_user": self.user_limit,
+                "per_admin_user": self.admin_user_limit,
+                "per_agent": self.agent_limit,
+            },
+            "running": self._running,
+            "queued": sum(len(q) for q in self._queues.values()),
+            "queued_by_user": {user: len(q) for user, q in self._queues.items()},
+            "running_by_user": dict(self._running_by_user),
+            "running_by_agent": dict(self._running_by_agent),
+            "started": self._started,
+            "avg_queue_wait_seconds": round(self._wait_seconds / self._started, 3) if self._started else 0.0,
+            "llm": llm_stats(),
+        }
+
+
+scheduler = EvaluationScheduler(
+    EVAL_GLOBAL_CONCURRENCY,
+    EVAL_USER_CONCURRENCY,
+    EVAL_ADMIN_USER_CONCURRENCY,
+    EVAL_AGENT_CONCURRENCY,
+)
+
+
+# Global cap on in-flight LLM / embedding calls. Scoring runs in worker
+# threads, so this is a thread semaphore rather than an asyncio one.
+
+_llm_semaphore = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+_llm_lock = threading.Lock()
+_llm_counts = {"in_flight": 0, "waiting": 0, "calls": 0}
+
+
+@contextmanager
+def llm_slot():
+    with _llm_lock:
+        _llm_counts["waiting"] += 1
+    _llm_semaphore.acquire()
+    with _llm_lock:
+        _llm_counts["waiting"] -= 1
+        _llm_counts["in_flight"] += 1
+        _llm_counts["calls"] += 1
+    try:
+        yield
+    finally:
+        with _llm_lock:
+            _llm_counts["in_flight"] -= 1
+        _llm_semaphore.release()
+
+
+def llm_stats():
+    with _llm_lock:
+        return dict(_llm_counts, limit=LLM_MAX_CONCURRENCY)
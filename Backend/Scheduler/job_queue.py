@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+from dotenv import load_dotenv
+
+from ..Model import app_db
+from ..Model.shared_cache import SHARED_STATE_DIR
+from .evaluation_scheduler import (
+    EVAL_GLOBAL_CONCURRENCY,
+    EVAL_USER_CONCURRENCY,
+    EVAL_ADMIN_USER_CONCURRENCY,
+    EVAL_AGENT_CONCURRENCY,
+    EVAL_QUEUE_TIMEOUT_SECONDS,
+    QueueTimeout,
+)
+
+load_dotenv()
+
+# Evaluation job queue shared by all worker processes (EVAL_DISPATCH=queue).
+#
+# Requests enqueue a row in a SQLite (WAL) file; consumer threads in every
+# worker claim jobs with BEGIN IMMEDIATE, so exactly one claims each job.
+# The claim query applies the same global / per-user / per-agent limits as
+# the in-process scheduler, but across processes, and serves the user whose
+# last run started longest ago first. A claim is a lease: if the worker dies,
+# the job goes back to the queue once the lease expires. While the handler
+# runs, a heartbeat renews the lease every third of EVAL_JOB_LEASE_SECONDS,
+# so long evaluations are never handed to a second worker.
+
+EVAL_DISPATCH = os.getenv("EVAL_DISPATCH", "inprocess")
+EVAL_JOB_DB_PATH = os.getenv("EVAL_JOB_DB_PATH", os.path.join(SHARED_STATE_DIR, "eval_jobs.db"))
+EVAL_QUEUE_CONSUMERS = int(os.getenv("EVAL_QUEUE_CONSUMERS", EVAL_GLOBAL_CONCURRENCY))
+EVAL_JOB_LEASE_SECONDS = int(os.getenv("EVAL_JOB_LEASE_SECONDS", 1800))
+EVAL_JOB_MAX_ATTEMPTS = int(os.getenv("EVAL_JOB_MAX_ATTEMPTS", 2))
+EVAL_JOB_POLL_SECONDS = float(os.getenv("EVAL_JOB_POLL_SECONDS", 0.5))
+EVAL_JOB_RETENTION_SECONDS = int(os.getenv("EVAL_JOB_RETENTION_SECONDS", 24 * 3600))
+
+INSERT_JOB_SQL = """
+    INSERT INTO eval_jobs (id, run_id, user, role, agent, payload, status, attempts, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, 'queued', 0, ?)
+"""
+EXPIRE_LEASES_SQL = """
+    UPDATE eval_jobs
+    SET status = CASE WHEN attempts >= :max_attempts THEN 'failed' ELSE 'queued' END,
+        finished_at = CASE WHEN attempts >= :max_attempts THEN :now ELSE NULL END,
+        error = 'worker lease expired', worker = NULL
+    WHERE status = 'running' AND lease_expires_at < :now
+"""
+COUNT_RUNNING_SQL = "SELECT COUNT(*) FROM eval_jobs WHERE status = 'running'"
+NEXT_JOB_SQL = """
+    SELECT j.id, j.payload FROM eval_jobs j
+    WHERE j.status = 'queued'
+      AND (SELECT COUNT(*) FROM eval_jobs r WHERE r.status = 'running' AND r.user = j.user)
+          < CASE WHEN j.role = 'admin' THEN ? ELSE ? END
+      AND (SELECT COUNT(*) FROM eval_jobs r WHERE r.status = 'running' AND r.agent = j.agent) < ?
+    ORDER BY (SELECT MAX(s.started_at) FROM eval_jobs s WHERE s.user = j.user), j.created_at
+    LIMIT 1
+"""
+CLAIM_JOB_SQL = """
+    UPDATE eval_jobs
+    SET status = 'running', worker = ?, attempts = attempts + 1, started_at = ?, lease_expires_at = ?
+    WHERE id = ?
+"""
+RENEW_LEASE_SQL = "UPDATE eval_jobs SET lease_expires_at = ? WHERE id = ? AND worker = ? AND status = 'running'"
+FINISH_JOB_SQL = "UPDATE eval_jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND worker = ?"
+CANCEL_JOB_SQL = "UPDATE eval_jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'"
+SELECT_JOB_SQL = "SELECT status, result, error FROM eval_jobs WHERE id = ?"
+PURGE_JOBS_SQL = "DELETE FROM eval_jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?"
+COUNT_BY_STATUS_SQL = "SELECT status, COUNT(*) FROM eval_jobs GROUP BY status"
+
+
+def create_jobs_table():
+    os.makedirs(os.path.dirname(os.path.abspath(EVAL_JOB_DB_PATH)), exist_ok=True)
+    with app_db.transaction(EVAL_JOB_DB_PATH) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS eval_jobs (
+                id TEXT PRIMARY KEY,
+                run_id TEXT NOT NULL,
+                user TEXT NOT NULL,
+                role TEXT,
+                agent TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                lease_expires_at REAL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_eval_jobs_status_user ON eval_jobs (status, user)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_eval_jobs_status_agent ON eval_jobs (status, agent)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_eval_jobs_user_started ON eval_jobs (user, started_at)")
+
+
+def enqueue(run_id, user, role, agent, payload):
+    job_id = str(uuid.uuid4())
+    with app_db.transaction(EVAL_JOB_DB_PATH) as conn:
+        conn.execute(INSERT_JOB_SQL, (job_id, run_id, user, role, agent, json.dumps(payload), time.time()))
+    return job_id
+
+
+def claim(worker):
+    """
+    Atomically take the next eligible job. Returns (job_id, payload) or None.
+    """
+    now = time.time()
+    with app_db.transaction(EVAL_JOB_DB_PATH) as conn:
+        # Take the write lock up front so two workers can't pick the same row
+        conn.execute("BEGIN IMMEDIATE")
+        # Failed jobs get finished_at so purge_finished() removes them too
+        conn.execute(EXPIRE_LEASES_SQL, {"max_attempts": EVAL_JOB_MAX_ATTEMPTS, "now": now})
+        if conn.execute(COUNT_RUNNING_SQL).fetchone()[0] >= EVAL_GLOBAL_CONCURRENCY:
+            return None
+        row = conn.execute(
+            NEXT_JOB_SQL, (EVAL_ADMIN_USER_CONCURRENCY, EVAL_USER_CONCURRENCY, EVAL_AGENT_CONCURRENCY)
+        ).fetchone()
+        if row is None:
+            return None
+        job_id, payload = row
+        conn.execute(CLAIM_JOB_SQL, (worker, now, now + EVAL_JOB_LEASE_SECONDS, job_id))
+    return job_id, json.loads(payload)
+
+
+def renew_lease(job_id, worker):
+    """
+    Extend a running job's lease. False if this worker no longer holds it.
+    """
+    with app_db.transaction(EVAL_JOB_DB_PATH) as conn:
+        cursor = conn.execute(RENEW_LEASE_SQL, (time.time() + EVAL_JOB_LEASE_SECONDS, job_id, worker))
+        return cursor.rowcount == 1
+
+
+def finish(job_id, worker, result=None, error=None):
+    status = "failed" if error is not None else "done"
+    with app_db.transaction(EVAL_JOB_DB_PATH) as conn:
+        cursor = conn.execute(FINISH_JOB_SQL, (status, json.dumps(result), error, time.time(), job_id, worker))
+        if cursor.rowcount == 0:
+            print(f"Evaluation job {job_id}: {status} result from {worker} dropped, the job is no longer leased to it")
+        return cursor.rowcount == 1
+
+
+def cancel_if_queued(job_id):
+    with app_db.transaction(EVAL_JOB_DB_PATH) as conn:
+        return conn.execute(CANCEL_JOB_SQL, (time.time(), job_id)).rowcount == 1
+
+
+def fetch_job(job_id):
+    with app_db.transaction(EVAL_JOB_DB_PATH) as conn:
+        row = conn.execute(SELECT_JOB_SQL, (job_id,)).fetchone()
+    if row is None:
+        return None
+    status, result, error = row
+    return {"status": status, "result": json.loads(result) if result else None, "error": error}
+
+
+def purge_finished():
+    with app_db.transaction(EVAL_JOB_DB_PATH) as conn:
+        return conn.execute(PURGE_JOBS_SQL, (time.time() - EVAL_JOB_RETENTION_SECONDS,)).rowcount
+
+
+async def run(run_id, user, role, agent, payload, timeout=EVAL_QUEUE_TIMEOUT_SECONDS):
+    """
+    Enqueue a job and wait for whichever worker picks it up. Raises
+    QueueTimeout if it is still queued after `timeout` seconds.
+    """
+    job_id = await asyncio.to_thread(enqueue, run_id, user, role, agent, payload)
+    deadline = time.monotonic() + timeout
+    while True:
+        await asyncio.sleep(EVAL_JOB_POLL_SECONDS)
+        job = await asyncio.to_thread(fetch_job, job_id)
+        if job is None or job["status"] == "cancelled":
+            raise RuntimeError("evaluation job was cancelled")
+        if job["status"] == "done":
+            return job["result"]
+        if job["status"] == "failed":
+            raise RuntimeError(f"evaluation job failed: {job['error']}")
+        if job["status"] == "queued" and time.monotonic() > deadline:
+            if await asyncio.to_thread(cancel_if_queued, job_id):
+                raise QueueTimeout(f"evaluation queue wait exceeded {timeout}s")
+
+
+# Consumers -------------------
+
+_consumer_stop = threading.Event()
+_consumers = []
+
+
+def _heartbeat(job_id, worker, done):
+    try:
+        while not done.wait(EVAL_JOB_LEASE_SECONDS / 3):
+            try:
+                if not renew_lease(job_id, worker):
+                    print(f"Evaluation job {job_id}: lease lost by {worker}")
+                    return
+            except Exception as e:
+                # Keep trying: the lease still has two thirds left
+                print(f"Evaluation job {job_id}: lease renewal failed: ", e)
+    finally:
+        app_db.close_thread_connections()
+
+
+def _finish_logged(job_id, worker, result=None, error=None):
+    """
+    finish() that never raises: a lost write must not kill the consumer thread.
+    """
+    try:
+        finish(job_id, worker, result=result, error=error)
+    except Exception as e:
+        print(f"Evaluation job {job_id}: storing the outcome failed: ", e)
+        if error is None:
+            # e.g. a result that isn't JSON-serialisable: fail the job rather than leave it running
+            try:
+                finish(job_id, worker, error=f"could not store result: {e}")
+            except Exception as e:
+                print(f"Evaluation job {job_id}: could not mark it failed either, its lease will expire: ", e)
+
+
+def _consume_forever(handler, worker):
+    idle_polls = 0
+    while not _consumer_stop.is_set():
+        try:
+            job = claim(worker)
+        except Exception as e:
+            print("Job queue claim failed: ", e)
+            job = None
+        if job is None:
+            idle_polls += 1
+            if idle_polls % 1000 == 0:
+                try:
+                    purge_finished()
+                except Exception as e:
+                    print("Job queue purge failed: ", e)
+            _consumer_stop.wait(EVAL_JOB_POLL_SECONDS)
+            continue
+
+        idle_polls = 0
+        job_id, payload = job
+        done = threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat, args=(job_id, worker, done), name=f"eval-heartbeat-{worker}", daemon=True
+        )
+        heartbeat.start()
+        try:
+            result = handler(payload)
+        except Exception as e:
+            print(f"Evaluation job {job_id} failed: ", e)
+            _finish_logged(job_id, worker, error=str(e))
+        else:
+            _finish_logged(job_id, worker, result=result)
+        finally:
+            done.set()
+            heartbeat.join()
+    app_db.close_thread_connections()
+
+
+def start_consumers(handler, count=EVAL_QUEUE_CONSUMERS):
+    """
+    Start `count` threads in this process that run handler(payload) -> JSON-able
+    result for each claimed job.
+    """
+    create_jobs_table()
+    _consumer_stop.clear()
+    for index in range(count):
+        worker = f"{os.getpid()}-{index}"
+        thread = threading.Thread(
+            target=_consume_forever, args=(handler, worker), name=f"eval-consumer-{index}", daemon=True
+        )
+        thread.start()
+        _consumers.append(thread)
+
+
+def stop_consumers():
+    _consumer_stop.set()
+    _consumers.clear()
+
+
+def stats():
+    with app_db.transaction(EVAL_JOB_DB_PATH) as conn:
+        counts = dict(conn.execute(COUNT_BY_STATUS_SQL).fetchall())
+    return {
+        "dispatch": EVAL_DISPATCH,
+        "consumers_in_this_worker": len(_consumers),
+        "jobs": counts,
+    }
@@ -0,0 +1,29 @@
+import json
+import argparse
+
+from ..Model import AIQTF_DB as sys_db
+from ..Bade_Papa.GenAI_SHAP.Scoring_Pipeline import rescore
+
+# Re-apply the current metric formulas to stored runs, offline.
+#
+#   python -m Backend.Tools.rescore                  # every run
+#   python -m Backend.Tools.rescore --run-id <id> --dry-run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score evaluation runs from stored scoring artifacts")
+    parser.add_argument("--run-id", default=None, help="only this run (default: all runs)")
+    parser.add_argument("--dry-run", action="store_true", help="report changes without writing them")
+    parser.add_argument("--batch-size", type=int, default=sys_db.RESULTS_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=rescore.score_metrics.METRICS_POOL_WORKERS,
+                        help="process pool size for metric computation (0 = in-process)")
+    args = parser.parse_args()
+
+    sys_db.init_db()
+    summary = rescore.rescore(args.run_id, args.dry_run, args.batch_size, args.workers)
+    rescore.score_metrics.shutdown()
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Measures how long a fresh worker takes to import the app, and checks that
+# the heavy dependencies (langchain, vector stores, tokenizer, DB drivers)
+# are still deferred until first use.
+#
+#   python -m Backend.Tools.startup_benchmark --runs 5
+#   python -m Backend.Tools.startup_benchmark --importtime 15
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+DEFAULT_MODULE = "Backend.Controller.Controller"
+
+HEAVY_MODULES = [
+    "langchain",
+    "langchain_core",
+    "langchain_openai",
+    "langchain_chroma",
+    "langchain_community",
+    "tiktoken",
+    "httpx",
+    "openai",
+    "psycopg2",
+    "asyncpg",
+    "aiosqlite",
+    "pyarrow",
+]
+
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+loaded = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+
+def probe(module):
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module, top):
+    # -X importtime writes "self | cumulative | name" lines to stderr
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold import time of the API")
+    parser.add_argument("--module", default=DEFAULT_MODULE)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", type=int, default=0, metavar="N",
+                        help="also list the N slowest imports (cumulative)")
+    args = parser.parse_args()
+
+    results = [probe(args.module) for _ in range(args.runs)]
+    seconds = [r["seconds"] for r in results]
+    print(f"{args.module}: {args.runs} cold imports")
+    print(f"  min {min(seconds) * 1000:.1f} ms  median {statistics.median(seconds) * 1000:.1f} ms  max {max(seconds) * 1000:.1f} ms")
+    loaded = results[-1]["loaded"]
+    print(f"  heavy modules loaded at import: {', '.join(loaded) if loaded else 'none'}")
+
+    if args.importtime:
+        print("  slowest imports (cumulative ms):")
+        for cumulative_us, _, name in slowest_imports(args.module, args.importtime):
+            print(f"    {cumulative_us / 1000:8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()